@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Calc interpreter.
+
+Usage:
+$ ./bench_calc.py
+$ ./bench_calc.py shapes
+"""
+
+import sys
+import tracemalloc
+from contextlib import redirect_stdout
+from io import BytesIO, StringIO
+from time import perf_counter
+
+from ast import literal_eval
+
+from calc_binary import program_to_bytes, program_from_bytes, dump_programs, load_programs
+from calc_bytecode import compile_bytecode, run_bytecode
+from calc_parser import parse_program
+from calc_profile import profile_program
+from calc_compile import compile_program
+from calc_transpile import compile_python
+from lab6 import exec_program, calc4
+
+
+def loop_program(n):
+    """Returns calc4 with the read statement replaced by n"""
+    return ['calc', ['set', 'n', n]] + calc4[2:]
+
+
+def squares_program(n):
+    """Returns a loop like calc4 that sums squares, which has no closed form"""
+    return ['calc', ['set', 'n', n], ['set', 'sum', 0],
+            ['while', ['n', '>', 0],
+             ['set', 'sum', ['sum', '+', ['n', '*', 'n']]],
+             ['set', 'n', ['n', '-', 1]]],
+            ['print', 'sum']]
+
+
+def many_variables_program(variables, n):
+    """Returns a program with many variables and a loop updating one of them"""
+    return (['calc'] + [['set', f'v{i}', i] for i in range(variables)]
+            + [['set', 'n', n],
+               ['while', ['n', '>', 0],
+                ['set', 'v0', ['v0', '+', ['n', '*', 'n']]],
+                ['set', 'n', ['n', '-', 1]]]])
+
+
+def deep_expression_program(depth):
+    """Returns a program assigning one expression nested depth levels deep"""
+    expression = 'x'
+    for i in range(depth):
+        expression = [expression, '+-*'[i % 3], i % 5 + 1]
+    return ['calc', ['set', 'x', 1], ['set', 'y', expression]]
+
+
+def straight_line_program(n):
+    """Returns a program of n assignments without loops or ifs"""
+    statements = [['set', 'a', 1], ['set', 'b', 2]]
+    for i in range(n - 2):
+        if i % 2:
+            statements.append(['set', 'a', [['b', '-', 'a'], '+', i]])
+        else:
+            statements.append(['set', 'b', [['a', '*', 2], '-', 'b']])
+    return ['calc'] + statements
+
+
+def nested_loops_program(depth, n):
+    """Returns depth nested loops of n iterations each around a sum"""
+    return ['calc', ['set', 'sum', 0]] + nested_loop_statements(depth, n, 0)
+
+
+def nested_loop_statements(depth, n, level):
+    """Returns the statements that run loop level and the loops inside it.
+    The counter is set before the loop so inner loops start over every time"""
+    counter = f'i{level}'
+    if level == depth - 1:
+        body = [['set', 'sum', ['sum', '+', ['i0', '*', counter]]]]
+    else:
+        body = nested_loop_statements(depth, n, level + 1)
+    return [['set', counter, n],
+            ['while', [counter, '>', 0]] + body + [['set', counter, [counter, '-', 1]]]]
+
+
+def best_time(function, repeat=3):
+    """Returns the best wall clock time of a number of calls to function"""
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        with redirect_stdout(StringIO()):
+            function()
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_compile(sizes=(1000, 10000, 100000)):
+    """Compares exec_program with the compiled engines on a loop"""
+    print(f"{'n':>8} {'exec_program':>14} {'closures':>16} {'bytecode':>16}"
+          f" {'python':>16}")
+    for n in sizes:
+        program = squares_program(n)
+        compiled = compile_program(program)
+        bytecode = compile_bytecode(program)
+        transpiled = compile_python(program)
+        with redirect_stdout(StringIO()):
+            assert (compiled() == exec_program(program) == run_bytecode(bytecode)
+                    == transpiled())
+        interpreted = best_time(lambda: exec_program(program))
+        closures = best_time(compiled)
+        vm = best_time(lambda: run_bytecode(bytecode))
+        python = best_time(transpiled)
+        print(f"{n:>8} {interpreted:>13.4f}s"
+              f" {closures:>8.4f}s {interpreted / closures:>5.1f}x"
+              f" {vm:>8.4f}s {interpreted / vm:>5.1f}x"
+              f" {python:>8.4f}s {interpreted / python:>5.1f}x")
+
+
+def bench_slots(sizes=(10, 100, 1000), n=10000):
+    """Compares copying and slot environments as the number of variables grows"""
+    print(f"{'variables':>9} {'copying':>10} {'slots':>10} {'speedup':>8}")
+    for variables in sizes:
+        program = many_variables_program(variables, n)
+        copying = best_time(lambda: exec_program(program))
+        slots = best_time(lambda: exec_program(program, fast=True))
+        print(f"{variables:>9} {copying:>9.4f}s {slots:>9.4f}s"
+              f" {copying / slots:>7.1f}x")
+
+
+def bench_closed_form(sizes=(1000, 100000, 10 ** 12)):
+    """Compares closed form and iterated evaluation of calc4"""
+    print(f"{'n':>14} {'closed form':>12} {'closures':>10}")
+    for n in sizes:
+        program = loop_program(n)
+        closed = best_time(lambda: exec_program(program))
+        if n <= 100000:
+            iterated = f"{best_time(compile_program(program)):>9.4f}s"
+        else:
+            iterated = f"{'-':>10}"
+        print(f"{n:>14} {closed:>11.6f}s {iterated}")
+
+
+def bench_parser(sizes=(1000, 10000, 100000)):
+    """Compares parse_program and ast.literal_eval on program text"""
+    print(f"{'characters':>10} {'literal_eval':>13} {'parser':>10} {'speedup':>8}")
+    for variables in sizes:
+        text = repr(many_variables_program(variables, 10))
+        assert parse_program(text) == literal_eval(text)
+        literal = best_time(lambda: literal_eval(text))
+        parser = best_time(lambda: parse_program(text))
+        print(f"{len(text):>10} {literal:>12.4f}s {parser:>9.4f}s"
+              f" {literal / parser:>7.1f}x")
+
+
+def bench_binary(sizes=(1000, 10000, 100000)):
+    """Compares loading programs from the binary format and from their repr"""
+    print(f"{'variables':>10} {'repr':>9} {'binary':>9} {'literal_eval':>13}"
+          f" {'eval':>10} {'binary':>10} {'vs literal':>10} {'vs eval':>8}")
+    for variables in sizes:
+        program = many_variables_program(variables, 10)
+        text = repr(program)
+        data = program_to_bytes(program)
+        assert program_from_bytes(data) == program
+        literal = best_time(lambda: literal_eval(text))
+        evaluated = best_time(lambda: eval(text))
+        binary = best_time(lambda: program_from_bytes(data))
+        print(f"{variables:>10} {len(text):>9} {len(data):>9} {literal:>12.4f}s"
+              f" {evaluated:>9.4f}s {binary:>9.4f}s {literal / binary:>9.1f}x"
+              f" {evaluated / binary:>7.1f}x")
+
+
+def mixed_library(size):
+    """Returns a dict of size named programs of the generated shapes"""
+    generators = [squares_program, loop_program,
+                  lambda i: straight_line_program(20),
+                  lambda i: deep_expression_program(20),
+                  lambda i: nested_loops_program(2, i),
+                  lambda i: many_variables_program(10, i)]
+    return {f'p{i}': generators[i % len(generators)](i) for i in range(size)}
+
+
+def bench_library(sizes=(1000, 10000, 100000)):
+    """Compares loading a library of mixed programs with load_programs and
+    from the repr of the dict"""
+    print(f"{'programs':>10} {'repr':>10} {'binary':>10} {'literal_eval':>13}"
+          f" {'eval':>10} {'binary':>10} {'vs literal':>10} {'vs eval':>8}")
+    for size in sizes:
+        library = mixed_library(size)
+        text = repr(library)
+        file = BytesIO()
+        dump_programs(library, file)
+        data = file.getvalue()
+        assert load_programs(BytesIO(data)) == library
+        literal = best_time(lambda: literal_eval(text))
+        evaluated = best_time(lambda: eval(text))
+        binary = best_time(lambda: load_programs(BytesIO(data)))
+        print(f"{size:>10} {len(text):>10} {len(data):>10} {literal:>12.4f}s"
+              f" {evaluated:>9.4f}s {binary:>9.4f}s {literal / binary:>9.1f}x"
+              f" {evaluated / binary:>7.1f}x")
+
+
+def operation_count(program):
+    """Returns the number of statements and expressions exec_program
+    evaluates when running a program"""
+    with redirect_stdout(StringIO()):
+        _, profile = profile_program(program)
+    return sum(profile.counts.values()) + profile.expression_evaluations
+
+
+def peak_memory(function):
+    """Returns the most memory allocated at once during a call to function"""
+    tracemalloc.start()
+    try:
+        with redirect_stdout(StringIO()):
+            function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+SHAPES = [
+    ('deep', deep_expression_program, (10, 100, 200)),
+    ('straight', straight_line_program, (100, 1000, 10000)),
+    ('nested', lambda n: nested_loops_program(3, n), (5, 10, 20)),
+    ('variables', lambda n: many_variables_program(n, 1000), (10, 100, 1000)),
+]
+
+
+def bench_shapes(shapes=SHAPES):
+    """Times exec_program on generated programs of different shapes, and
+    the same program compiled to slots without copying the variable table.
+    Operations are statements executed plus expressions evaluated"""
+    print(f"{'shape':>9} {'size':>6} {'operations':>10} {'time':>9}"
+          f" {'ops/s':>10} {'slots ops/s':>11} {'peak KiB':>9}")
+    for name, generate, sizes in shapes:
+        for size in sizes:
+            program = generate(size)
+            operations = operation_count(program)
+            elapsed = best_time(lambda: exec_program(program))
+            fast = best_time(compile_program(program))
+            peak = peak_memory(lambda: exec_program(program))
+            print(f"{name:>9} {size:>6} {operations:>10} {elapsed:>8.4f}s"
+                  f" {operations / elapsed:>10.0f} {operations / fast:>11.0f}"
+                  f" {peak / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['shapes']:
+        bench_shapes()
+        sys.exit()
+    bench_compile()
+    print()
+    bench_slots()
+    print()
+    bench_closed_form()
+    print()
+    bench_parser()
+    print()
+    bench_binary()
+    print()
+    bench_library()
+    print()
+    bench_shapes()
@@ -125,8 +125,23 @@ def output_expression(p):
 
 # ----- EXPRESSION -----
 
-# No functions for expressions in general. Instead, see the differenct
-# types of expressions: constants, variables and binary expressions.
+# Apart from is_expression, no functions for expressions in general.
+# Instead, see the differenct types of expressions: constants, variables,
+# binary expressions, arrays and indexing.
+
+
+def is_expression(p):
+    # Checks the whole expression. Uses a list of parts left to check
+    # instead of recursion, so any depth of nesting works
+    todo = [p]
+    while todo:
+        p = todo.pop()
+        if is_binaryexpr(p) or is_indexing(p):
+            todo.append(p[0])
+            todo.append(p[2])
+        elif not (is_constant(p) or is_variable(p) or is_array(p)):
+            return False
+    return True
 
 
 # ----- BINARYEXPR -----
@@ -148,6 +163,39 @@ def binaryexpr_right(p):
     return p[2]
 
 
+# ----- ARRAY -----
+
+# An array constant, e.g. ['array', 1, 2, 3]. The arithmetic operators work
+# element by element on arrays, and between an array and a number.
+
+
+def is_array(p):
+    return (isinstance(p, list) and len(p) > 1 and p[0] == 'array'
+            and all(is_constant(value) for value in p[1:]))
+
+
+def array_values(p):
+    return p[1:]
+
+
+# ----- INDEXING -----
+
+# One element of an array, e.g. ['a', 'at', 0]. Indexes are integers
+# starting at 0.
+
+
+def is_indexing(p):
+    return isinstance(p, list) and len(p) == 3 and p[1] == 'at'
+
+
+def indexing_array(p):
+    return p[0]
+
+
+def indexing_index(p):
+    return p[2]
+
+
 # ----- CONDITION -----
 
 
@@ -248,16 +296,24 @@ def is_constant(p):
     (* En utmatningssats anger ett uttryck vars värde ska skrivas ut. *)
     OUTPUT = '[', "'print'", COMMA, EXPRESSION, ']' ;
 
-    (* Ett matematiskt uttryck kan vara en konstant, en variabel eller
-       ett binärt uttryck. *)
+    (* Ett matematiskt uttryck kan vara en konstant, en variabel,
+       ett binärt uttryck, en array eller ett element i en array. *)
     EXPRESSION =
         CONSTANT
       | VARIABLE
-      | BINARYEXPR ;
+      | BINARYEXPR
+      | ARRAY
+      | INDEXING ;
 
     (* Ett binärt uttryck består av två uttryck med en matematisk operator i mitten. *)
     BINARYEXPR = '[', EXPRESSION, COMMA, BINARYOPER, COMMA, EXPRESSION, ']' ;
 
+    (* En array består av en eller flera konstanter. *)
+    ARRAY = '[', "'array'", COMMA, CONSTANT, { COMMA, CONSTANT }, ']' ;
+
+    (* Ett element i en array väljs med ett index som börjar på 0. *)
+    INDEXING = '[', EXPRESSION, COMMA, "'at'", COMMA, EXPRESSION, ']' ;
+
     (* Ett villkor består av två uttryck med en villkorsoperator i mitten. *)
     CONDITION = '[', EXPRESSION, COMMA, CONDOPER, COMMA, EXPRESSION, ']' ;
 
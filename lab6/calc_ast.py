@@ -0,0 +1,361 @@
+from calc import *
+from calc_io import STDIO
+
+# ----------------------------------------------------------------------------
+#  Validated node representation of Calc programs
+# ----------------------------------------------------------------------------
+
+# validate_program checks a whole program in the list form once and turns
+# it into nodes. Every node class has a tag number, so code working on
+# nodes can look up what to do in a list instead of trying the is_*
+# predicates one after the other. All syntax errors are collected and
+# reported together with their path, the list of indexes that leads from
+# the program to the faulty part.
+
+PROGRAM = 0
+ASSIGNMENT = 1
+REPETITION = 2
+SELECTION = 3
+INPUT = 4
+OUTPUT = 5
+CONSTANT = 6
+VARIABLE = 7
+BINARYEXPR = 8
+CONDITION = 9
+
+
+class CalcSyntaxError(SyntaxError):
+    """Raised with every (path, message) pair found in an invalid program"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("\n".join(f"{format_path(path)}: {message}"
+                                   for path, message in errors))
+
+
+def format_path(path):
+    """Formats a path as the indexing that reaches it, e.g. program[3][2]"""
+    return "program" + "".join(f"[{index}]" for index in path)
+
+
+class Node:
+    """Base class of all nodes, tag tells which kind of node it is"""
+    __slots__ = ()
+    tag = None
+
+
+class Program(Node):
+    __slots__ = ('statements', 'writes')
+    tag = PROGRAM
+
+    def __init__(self, statements, writes):
+        self.statements = statements
+        self.writes = writes
+
+
+class Assignment(Node):
+    __slots__ = ('variable', 'expression')
+    tag = ASSIGNMENT
+
+    def __init__(self, variable, expression):
+        self.variable = variable
+        self.expression = expression
+
+
+class Repetition(Node):
+    __slots__ = ('condition', 'statements')
+    tag = REPETITION
+
+    def __init__(self, condition, statements):
+        self.condition = condition
+        self.statements = statements
+
+
+class Selection(Node):
+    __slots__ = ('condition', 'true_branch', 'false_branch')
+    tag = SELECTION
+
+    def __init__(self, condition, true_branch, false_branch):
+        self.condition = condition
+        self.true_branch = true_branch
+        self.false_branch = false_branch
+
+
+class Input(Node):
+    __slots__ = ('variable',)
+    tag = INPUT
+
+    def __init__(self, variable):
+        self.variable = variable
+
+
+class Output(Node):
+    __slots__ = ('expression',)
+    tag = OUTPUT
+
+    def __init__(self, expression):
+        self.expression = expression
+
+
+class Constant(Node):
+    __slots__ = ('value',)
+    tag = CONSTANT
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Variable(Node):
+    __slots__ = ('name',)
+    tag = VARIABLE
+
+    def __init__(self, name):
+        self.name = name
+
+
+class BinaryExpr(Node):
+    __slots__ = ('left', 'operator', 'right')
+    tag = BINARYEXPR
+
+    def __init__(self, left, operator, right):
+        self.left = left
+        self.operator = operator
+        self.right = right
+
+
+class Condition(Node):
+    __slots__ = ('left', 'operator', 'right')
+    tag = CONDITION
+
+    def __init__(self, left, operator, right):
+        self.left = left
+        self.operator = operator
+        self.right = right
+
+
+# ----- VALIDATION -----
+
+
+def validate_program(lst):
+    """Checks a whole calc program and returns it as nodes.
+    Raises CalcSyntaxError listing every error if it is not valid"""
+    errors = []
+    if not is_program(lst):
+        raise CalcSyntaxError([((), "not a program, expected ['calc', STATEMENTS]")])
+    statements = [validate_statement(statement, (index,), errors)
+                  for index, statement in enumerate(program_statements(lst), 1)]
+    if errors:
+        raise CalcSyntaxError(errors)
+    return Program(statements, any(writes(statement) for statement in statements))
+
+
+def validate_statement(p, path, errors):
+    """Checks one statement and returns its node, or None if it is not valid"""
+    if is_assignment(p):
+        if not is_variable(assignment_variable(p)):
+            errors.append((path + (1,), "not a variable"))
+        return Assignment(assignment_variable(p),
+                          validate_expression(assignment_expression(p), path + (2,), errors))
+    elif is_repetition(p):
+        return Repetition(
+            validate_condition(repetition_condition(p), path + (1,), errors),
+            [validate_statement(statement, path + (index,), errors)
+             for index, statement in enumerate(repetition_statements(p), 2)])
+    elif is_selection(p):
+        false_branch = None
+        if selection_has_false_branch(p):
+            false_branch = validate_statement(selection_false_branch(p), path + (3,), errors)
+        return Selection(
+            validate_condition(selection_condition(p), path + (1,), errors),
+            validate_statement(selection_true_branch(p), path + (2,), errors),
+            false_branch)
+    elif is_input(p):
+        if not is_variable(input_variable(p)):
+            errors.append((path + (1,), "not a variable"))
+        return Input(input_variable(p))
+    elif is_output(p):
+        return Output(validate_expression(output_expression(p), path + (1,), errors))
+    errors.append((path, f"not a statement: {p!r}"))
+    return None
+
+
+def validate_condition(p, path, errors):
+    """Checks a condition and returns its node"""
+    if not is_condition(p):
+        errors.append((path, f"not a condition: {p!r}"))
+        return None
+    return Condition(validate_expression(condition_left(p), path + (0,), errors),
+                     condition_operator(p),
+                     validate_expression(condition_right(p), path + (2,), errors))
+
+
+def validate_expression(p, path, errors):
+    """Checks an expression and returns its node.
+    Nested binary expressions are handled with a stack of their own instead
+    of recursion, so any depth of nesting works"""
+    nodes = []
+    # Each item is (expression, index in its parent, item of the parent),
+    # or the operator of a binary expression whose sides are done
+    todo = [(p, None, None)]
+    while todo:
+        item = todo.pop()
+        if isinstance(item, str):
+            right = nodes.pop()
+            nodes.append(BinaryExpr(nodes.pop(), item, right))
+            continue
+        p = item[0]
+        if is_variable(p):
+            nodes.append(Variable(p))
+        elif is_constant(p):
+            nodes.append(Constant(p))
+        elif is_binaryexpr(p):
+            todo.append(binaryexpr_operator(p))
+            todo.append((binaryexpr_right(p), 2, item))
+            todo.append((binaryexpr_left(p), 0, item))
+        else:
+            errors.append((path + expression_path(item), f"not an expression: {p!r}"))
+            nodes.append(None)
+    return nodes[0]
+
+
+def expression_path(item):
+    """Returns the path from the outermost expression to a todo item
+    of validate_expression"""
+    indexes = []
+    while item[2] is not None:
+        indexes.append(item[1])
+        item = item[2]
+    return tuple(reversed(indexes))
+
+
+def writes(node):
+    """Returns whether a statement node can change the variable table"""
+    if node.tag == ASSIGNMENT or node.tag == INPUT:
+        return True
+    elif node.tag == REPETITION:
+        return any(writes(statement) for statement in node.statements)
+    elif node.tag == SELECTION:
+        return writes(node.true_branch) or (
+            node.false_branch is not None and writes(node.false_branch))
+    return False
+
+
+# ----- INTERPRETER -----
+
+# The interpreter works on one mutable copy of the variable table and looks
+# up the function for a node by its tag.
+
+
+def exec_validated(program, dic=None, io=STDIO):
+    """Runs a validated program and returns the resulting variable table"""
+    if dic is None:
+        dic = {}
+    if not program.writes:
+        env = dic
+    else:
+        env = dic.copy()
+    for statement in program.statements:
+        EXEC[statement.tag](statement, env, io)
+    return env
+
+
+def exec_node_assignment(node, env, io):
+    """Assigns a variable the value of an expression"""
+    env[node.variable] = EVAL[node.expression.tag](node.expression, env)
+
+
+def exec_node_repetition(node, env, io):
+    """Runs a while loop"""
+    condition = node.condition
+    statements = node.statements
+    while eval_node_condition(condition, env):
+        for statement in statements:
+            EXEC[statement.tag](statement, env, io)
+
+
+def exec_node_selection(node, env, io):
+    """Runs one of the branches of an if statement"""
+    if eval_node_condition(node.condition, env):
+        EXEC[node.true_branch.tag](node.true_branch, env, io)
+    elif node.false_branch is not None:
+        EXEC[node.false_branch.tag](node.false_branch, env, io)
+
+
+def exec_node_input(node, env, io):
+    """Reads a value for a variable"""
+    env[node.variable] = int(io.input(f"Enter value for {node.variable}: "))
+
+
+def exec_node_output(node, env, io):
+    """Prints an expression"""
+    expression = node.expression
+    if expression.tag == VARIABLE and expression.name in env:
+        io.print(expression.name + " =", + env[expression.name])
+    else:
+        io.print(EVAL[expression.tag](expression, env))
+
+
+def eval_node_condition(node, env):
+    """Returns whether a condition is true"""
+    left = EVAL[node.left.tag](node.left, env)
+    right = EVAL[node.right.tag](node.right, env)
+    if node.operator == '>':
+        return left > right
+    elif node.operator == '<':
+        return left < right
+    return left == right
+
+
+def eval_node_constant(node, env):
+    """Returns the value of a constant"""
+    return node.value
+
+
+def eval_node_variable(node, env):
+    """Returns the value of a variable"""
+    return env.get(node.name)
+
+
+def eval_node_binaryexpr(node, env):
+    """Does the math for a binary expression.
+    Uses a stack of its own instead of recursion, so any depth of nesting works"""
+    values = []
+    # Nodes left to evaluate, and operators waiting for both their sides
+    todo = [node]
+    while todo:
+        node = todo.pop()
+        if isinstance(node, str):
+            right = values.pop()
+            left = values.pop()
+            if node == '+':
+                values.append(left + right)
+            elif node == '-':
+                values.append(left - right)
+            elif node == '*':
+                values.append(left * right)
+            else:
+                if right == 0:
+                    raise Exception("Division is by zero")
+                values.append(left / right)
+        elif node.tag == BINARYEXPR:
+            todo.append(node.operator)
+            todo.append(node.right)
+            todo.append(node.left)
+        elif node.tag == VARIABLE:
+            values.append(env.get(node.name))
+        else:
+            values.append(node.value)
+    return values[0]
+
+
+EXEC = [None] * 10
+EXEC[ASSIGNMENT] = exec_node_assignment
+EXEC[REPETITION] = exec_node_repetition
+EXEC[SELECTION] = exec_node_selection
+EXEC[INPUT] = exec_node_input
+EXEC[OUTPUT] = exec_node_output
+
+EVAL = [None] * 10
+EVAL[CONSTANT] = eval_node_constant
+EVAL[VARIABLE] = eval_node_variable
+EVAL[BINARYEXPR] = eval_node_binaryexpr
@@ -0,0 +1,93 @@
+import asyncio
+
+from calc_ast import *
+from calc_io import CalcIO
+
+# ----------------------------------------------------------------------------
+#  Running Calc programs as asyncio coroutines
+# ----------------------------------------------------------------------------
+
+# async_exec_program runs a program inside an event loop, so one process
+# can run many interactive sessions at the same time. A read statement
+# awaits the read coroutine given by the caller instead of blocking in
+# input(), and a while loop gives the other sessions a turn every
+# yield_every iterations.
+#
+# The program is validated first and run on the nodes from calc_ast.
+# Assignments and prints never wait, so they are run by the same functions
+# as in exec_validated; only reads, whiles and ifs have async versions.
+
+YIELD_EVERY = 1000
+
+
+class Session:
+    """What one running program reads from and prints to"""
+
+    def __init__(self, read, io, yield_every):
+        self.read = read
+        self.io = io
+        self.yield_every = yield_every
+        self.countdown = yield_every
+
+
+async def read_terminal(prompt):
+    """Reads a value from the terminal in another thread"""
+    return await asyncio.to_thread(input, prompt)
+
+
+async def async_exec_program(program, dic=None, read=None, output=None,
+                             yield_every=YIELD_EVERY):
+    """Runs a calc program, in the list form or validated, in the event loop
+    and returns the resulting variable table.
+    read is a coroutine function that is given the prompt and returns the
+    value for a read statement, by default it is read from the terminal"""
+    if not isinstance(program, Program):
+        program = validate_program(program)
+    if dic is None:
+        dic = {}
+    env = dic.copy() if program.writes else dic
+    session = Session(read or read_terminal, CalcIO((), output), yield_every)
+    await async_exec_statements(program.statements, env, session)
+    return env
+
+
+async def async_exec_statements(statements, env, session):
+    """Runs a list of statements"""
+    io = session.io
+    for statement in statements:
+        tag = statement.tag
+        if ASYNC_EXEC[tag] is None:
+            EXEC[tag](statement, env, io)
+        else:
+            await ASYNC_EXEC[tag](statement, env, session)
+
+
+async def async_exec_repetition(node, env, session):
+    """Runs a while loop, letting other tasks run now and then"""
+    condition = node.condition
+    statements = node.statements
+    while eval_node_condition(condition, env):
+        await async_exec_statements(statements, env, session)
+        session.countdown -= 1
+        if session.countdown <= 0:
+            session.countdown = session.yield_every
+            await asyncio.sleep(0)
+
+
+async def async_exec_selection(node, env, session):
+    """Runs one of the branches of an if statement"""
+    if eval_node_condition(node.condition, env):
+        await async_exec_statements([node.true_branch], env, session)
+    elif node.false_branch is not None:
+        await async_exec_statements([node.false_branch], env, session)
+
+
+async def async_exec_input(node, env, session):
+    """Waits for a value for a variable"""
+    env[node.variable] = int(await session.read(f"Enter value for {node.variable}: "))
+
+
+ASYNC_EXEC = [None] * 10
+ASYNC_EXEC[REPETITION] = async_exec_repetition
+ASYNC_EXEC[SELECTION] = async_exec_selection
+ASYNC_EXEC[INPUT] = async_exec_input
@@ -0,0 +1,152 @@
+import numpy as np
+
+from calc import *
+
+# ----------------------------------------------------------------------------
+#  Batch execution of a Calc program over many inputs with NumPy
+# ----------------------------------------------------------------------------
+
+# exec_program_batch runs one program for every row of an input table at
+# the same time. Every variable is an array with one value per row (a
+# "lane"), and arithmetic and conditions work on whole arrays. if and while
+# statements are run with a mask telling which lanes take part: an if runs
+# each branch for the lanes where the condition has that value, and a while
+# keeps going as long as any lane still has a true condition, with lanes
+# dropping out of the mask as their condition becomes false.
+#
+# Differences from exec_program:
+#  * values are NumPy int64 or float64, so integers can overflow,
+#  * print statements are skipped,
+#  * reading a variable that has no value in some lane raises TypeError.
+
+
+def exec_program_batch(program, inputs, dic=None):
+    """Runs a calc program once for every row of inputs.
+    The k:th read statement executed in a run takes column k of its row.
+    Returns a dict with an array of values for each variable; rows where a
+    variable never got a value hold NaN"""
+    if not is_program(program):
+        raise SyntaxError("Not a program")
+    inputs = np.asarray(inputs)
+    if inputs.ndim == 1:
+        inputs = inputs.reshape(-1, 1)
+    state = BatchState(inputs, dic or {})
+    exec_batch_statements(program_statements(program), state, state.all_lanes())
+    return state.result()
+
+
+class BatchState:
+    """The variables and read positions of all lanes"""
+
+    def __init__(self, inputs, dic):
+        self.inputs = inputs.astype(np.int64)
+        self.rows = inputs.shape[0]
+        self.lanes = np.arange(self.rows)
+        self.read_position = np.zeros(self.rows, dtype=np.int64)
+        self.values = {}
+        self.defined = {}
+        for variable, value in dic.items():
+            self.values[variable] = np.full(self.rows, value)
+            self.defined[variable] = self.all_lanes()
+
+    def all_lanes(self):
+        """Returns a mask with every lane active"""
+        return np.ones(self.rows, dtype=bool)
+
+    def assign(self, variable, value, mask):
+        """Sets variable to value in the lanes of mask"""
+        value = np.broadcast_to(value, (self.rows,))
+        if variable in self.values:
+            self.values[variable] = np.where(mask, value, self.values[variable])
+            self.defined[variable] = self.defined[variable] | mask
+        else:
+            self.values[variable] = np.where(mask, value, np.zeros(1, dtype=value.dtype))
+            self.defined[variable] = mask.copy()
+
+    def result(self):
+        """Returns the variables as arrays"""
+        result = {}
+        for variable, values in self.values.items():
+            defined = self.defined[variable]
+            if not defined.all():
+                values = np.where(defined, values, np.nan)
+            result[variable] = values
+        return result
+
+
+def exec_batch_statements(statements, state, mask):
+    """Runs a list of statements in the lanes of mask"""
+    for statement in statements:
+        exec_batch_statement(statement, state, mask)
+
+
+def exec_batch_statement(statement, state, mask):
+    """Checks what kind of a statement it is and runs it in the lanes of mask"""
+    if is_assignment(statement):
+        value = eval_batch_expression(assignment_expression(statement), state, mask)
+        state.assign(assignment_variable(statement), value, mask)
+    elif is_repetition(statement):
+        condition = repetition_condition(statement)
+        body = repetition_statements(statement)
+        active = mask & eval_batch_condition(condition, state, mask)
+        while active.any():
+            exec_batch_statements(body, state, active)
+            active = active & eval_batch_condition(condition, state, active)
+    elif is_selection(statement):
+        condition = eval_batch_condition(selection_condition(statement), state, mask)
+        true_lanes = mask & condition
+        false_lanes = mask & ~condition
+        if true_lanes.any():
+            exec_batch_statement(selection_true_branch(statement), state, true_lanes)
+        if selection_has_false_branch(statement) and false_lanes.any():
+            exec_batch_statement(selection_false_branch(statement), state, false_lanes)
+    elif is_input(statement):
+        position = state.read_position
+        if (position[mask] >= state.inputs.shape[1]).any():
+            raise EOFError("Not enough input columns for read")
+        column = np.minimum(position, state.inputs.shape[1] - 1)
+        state.assign(input_variable(statement), state.inputs[state.lanes, column], mask)
+        state.read_position = position + mask
+    elif not is_output(statement):
+        raise SyntaxError(f"Not a statement: {statement!r}")
+
+
+def eval_batch_condition(condition, state, mask):
+    """Returns a boolean array telling in which lanes a condition is true"""
+    if not is_condition(condition):
+        raise SyntaxError(f"Not a condition: {condition!r}")
+    left = eval_batch_expression(condition_left(condition), state, mask)
+    right = eval_batch_expression(condition_right(condition), state, mask)
+    operator = condition_operator(condition)
+    if operator == '>':
+        result = left > right
+    elif operator == '<':
+        result = left < right
+    else:
+        result = left == right
+    return np.broadcast_to(result, (state.rows,))
+
+
+def eval_batch_expression(expression, state, mask):
+    """Evaluates an expression in every lane, only the lanes of mask must be valid"""
+    if is_variable(expression):
+        if expression not in state.values or not state.defined[expression][mask].all():
+            raise TypeError(f"Variable {expression} has no value")
+        return state.values[expression]
+    elif is_binaryexpr(expression):
+        left = eval_batch_expression(binaryexpr_left(expression), state, mask)
+        right = eval_batch_expression(binaryexpr_right(expression), state, mask)
+        operator = binaryexpr_operator(expression)
+        if operator == '+':
+            return left + right
+        elif operator == '-':
+            return left - right
+        elif operator == '*':
+            return left * right
+        zero = np.broadcast_to(right == 0, (state.rows,))
+        if zero[mask].any():
+            raise Exception("Division is by zero")
+        return np.true_divide(left, np.where(zero, 1, right))
+    elif is_constant(expression):
+        return expression
+    raise SyntaxError(f"Not an expression: {expression!r}")
@@ -0,0 +1,316 @@
+import gc
+
+from calc import *
+from calc_bytecode import write_varint, read_varint, zigzag, unzigzag, double
+
+# ----------------------------------------------------------------------------
+#  Compact binary format for Calc programs in the list form
+# ----------------------------------------------------------------------------
+
+# Programs are stored in postfix order: the parts of every list come before
+# the opcode byte that puts them together, e.g. ['x', '+', 1] is
+#     OP_VARIABLE 0  OP_INT 2  OP_ADD
+# so loading is a single loop over the bytes with a stack of finished parts,
+# without recursion and without parsing any text. Variable names are stored
+# once in a table at the start and referred to by their number.
+#
+# File layout, all integers are unsigned LEB128 varints:
+#   AST_MAGIC, AST_VERSION byte
+#   number of names, then each name as length + UTF-8 bytes
+#   number of keys, then the name number of each key (only in libraries)
+#   the code, up to the end of the data
+# Integer constants are zigzag encoded so negative numbers stay small.
+
+AST_MAGIC = b'CALCAST'
+AST_VERSION = 1
+
+# Opcodes that take a name number
+OP_VARIABLE = 0
+OP_SET = 1
+OP_READ = 2
+# Opcodes that take a value
+OP_INT = 3
+OP_FLOAT = 4
+# Opcodes without argument
+OP_TRUE = 5
+OP_FALSE = 6
+OP_ADD = 7
+OP_SUB = 8
+OP_MUL = 9
+OP_DIV = 10
+OP_LESS = 11
+OP_GREATER = 12
+OP_EQUAL = 13
+OP_PRINT = 14
+OP_IF = 15
+OP_IF_ELSE = 16
+# Opcodes that take a number of statements
+OP_WHILE = 17
+OP_PROGRAM = 18
+# Takes the number of values of an array constant
+OP_ARRAY = 19
+# Without argument, an element of an array
+OP_AT = 20
+
+OPCODES = {'+': OP_ADD, '-': OP_SUB, '*': OP_MUL, '/': OP_DIV,
+           '<': OP_LESS, '>': OP_GREATER, '=': OP_EQUAL}
+OPERATORS = {op: operator for operator, op in OPCODES.items()}
+
+
+# ----- WRITING -----
+
+
+def program_to_bytes(lst):
+    """Encodes a calc program in the binary format"""
+    encoder = Encoder()
+    encoder.program(lst)
+    return encoder.to_bytes([])
+
+
+def dump_program(lst, file):
+    """Writes a calc program to a binary file"""
+    file.write(program_to_bytes(lst))
+
+
+def dump_programs(programs, file):
+    """Writes a dict of named calc programs to a binary file"""
+    encoder = Encoder()
+    keys = [encoder.name(key) for key in programs]
+    for lst in programs.values():
+        encoder.program(lst)
+    file.write(encoder.to_bytes(keys))
+
+
+class Encoder:
+    """Collects the name table and code of one or more programs"""
+
+    def __init__(self):
+        self.names = {}
+        self.code = bytearray()
+
+    def name(self, variable):
+        """Returns the number of a name, giving it one if it has none"""
+        if not is_variable(variable):
+            raise SyntaxError(f"Not a variable: {variable!r}")
+        if variable not in self.names:
+            self.names[variable] = len(self.names)
+        return self.names[variable]
+
+    def to_bytes(self, keys):
+        """Returns the whole file with the given key numbers"""
+        out = bytearray(AST_MAGIC)
+        out.append(AST_VERSION)
+        write_varint(out, len(self.names))
+        for name in self.names:
+            encoded = name.encode('utf-8')
+            write_varint(out, len(encoded))
+            out += encoded
+        write_varint(out, len(keys))
+        for key in keys:
+            write_varint(out, key)
+        return bytes(out + self.code)
+
+    def program(self, lst):
+        if not is_program(lst):
+            raise SyntaxError("Not a program")
+        for statement in program_statements(lst):
+            self.statement(statement)
+        self.code.append(OP_PROGRAM)
+        write_varint(self.code, len(program_statements(lst)))
+
+    def statement(self, p):
+        code = self.code
+        if is_assignment(p):
+            self.expression(assignment_expression(p))
+            code.append(OP_SET)
+            write_varint(code, self.name(assignment_variable(p)))
+        elif is_output(p):
+            self.expression(output_expression(p))
+            code.append(OP_PRINT)
+        elif is_input(p):
+            code.append(OP_READ)
+            write_varint(code, self.name(input_variable(p)))
+        elif is_repetition(p):
+            self.condition(repetition_condition(p))
+            for statement in repetition_statements(p):
+                self.statement(statement)
+            code.append(OP_WHILE)
+            write_varint(code, len(repetition_statements(p)))
+        elif is_selection(p):
+            self.condition(selection_condition(p))
+            self.statement(selection_true_branch(p))
+            if selection_has_false_branch(p):
+                self.statement(selection_false_branch(p))
+                code.append(OP_IF_ELSE)
+            else:
+                code.append(OP_IF)
+        else:
+            raise SyntaxError(f"Not a statement: {p!r}")
+
+    def condition(self, p):
+        if not is_condition(p):
+            raise SyntaxError(f"Not a condition: {p!r}")
+        self.expression(condition_left(p))
+        self.expression(condition_right(p))
+        self.code.append(OPCODES[condition_operator(p)])
+
+    def expression(self, p):
+        # Postfix order with a stack of its own, like eval_binaryexpr.
+        # Opcodes waiting for both sides are kept as 1-tuples
+        code = self.code
+        todo = [p]
+        while todo:
+            p = todo.pop()
+            if isinstance(p, tuple):
+                code.append(p[0])
+            elif is_binaryexpr(p):
+                todo.append((OPCODES[binaryexpr_operator(p)],))
+                todo.append(binaryexpr_right(p))
+                todo.append(binaryexpr_left(p))
+            elif is_indexing(p):
+                todo.append((OP_AT,))
+                todo.append(indexing_index(p))
+                todo.append(indexing_array(p))
+            elif is_array(p):
+                for value in array_values(p):
+                    self.constant(value)
+                code.append(OP_ARRAY)
+                write_varint(code, len(array_values(p)))
+            elif is_variable(p):
+                code.append(OP_VARIABLE)
+                write_varint(code, self.name(p))
+            else:
+                self.constant(p)
+
+    def constant(self, p):
+        code = self.code
+        if isinstance(p, bool):
+            code.append(OP_TRUE if p else OP_FALSE)
+        elif isinstance(p, int):
+            code.append(OP_INT)
+            write_varint(code, zigzag(p))
+        elif isinstance(p, float):
+            code.append(OP_FLOAT)
+            code += double.pack(p)
+        else:
+            raise SyntaxError(f"Not an expression: {p!r}")
+
+
+# ----- READING -----
+
+
+def program_from_bytes(data):
+    """Decodes a calc program from the binary format"""
+    keys, programs = decode(data)
+    if keys or len(programs) != 1:
+        raise ValueError("Not a single calc program")
+    return programs[0]
+
+
+def load_program(file):
+    """Reads a calc program written by dump_program"""
+    return program_from_bytes(file.read())
+
+
+def load_programs(file):
+    """Reads a dict of named calc programs written by dump_programs"""
+    keys, programs = decode(file.read())
+    if len(keys) != len(programs):
+        raise ValueError("Not a calc program library")
+    return dict(zip(keys, programs))
+
+
+def decode(data):
+    """Returns the keys and the programs in a file in the binary format"""
+    if data[:len(AST_MAGIC)] != AST_MAGIC:
+        raise ValueError("Not a binary calc program")
+    pos = len(AST_MAGIC)
+    if data[pos] != AST_VERSION:
+        raise ValueError(f"Unsupported binary calc program version {data[pos]}")
+    count, pos = read_varint(data, pos + 1)
+    names = []
+    for _ in range(count):
+        length, pos = read_varint(data, pos)
+        names.append(data[pos:pos + length].decode('utf-8'))
+        pos += length
+    count, pos = read_varint(data, pos)
+    keys = []
+    for _ in range(count):
+        key, pos = read_varint(data, pos)
+        keys.append(names[key])
+    # Loading only creates new lists that never form cycles, but so many of
+    # them that the garbage collector would run over and over on a large
+    # library, so it is paused meanwhile
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return keys, decode_code(data, pos, names)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def decode_code(data, pos, names):
+    """Runs the code from pos to the end and returns the finished programs"""
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    operators = [OPERATORS.get(op) for op in range(OP_PROGRAM + 1)]
+    end = len(data)
+    try:
+        while pos < end:
+            op = data[pos]
+            pos += 1
+            if op <= OP_INT:
+                # Every opcode up to OP_INT takes a varint, most fit in one byte
+                arg = data[pos]
+                pos += 1
+                if arg > 0x7f:
+                    arg, pos = read_varint(data, pos - 1)
+                if op == OP_VARIABLE:
+                    push(names[arg])
+                elif op == OP_INT:
+                    push(unzigzag(arg))
+                elif op == OP_SET:
+                    stack[-1] = ['set', names[arg], stack[-1]]
+                else:
+                    push(['read', names[arg]])
+            elif op <= OP_EQUAL:
+                if op >= OP_ADD:
+                    right = pop()
+                    stack[-1] = [stack[-1], operators[op], right]
+                elif op == OP_FLOAT:
+                    push(double.unpack_from(data, pos)[0])
+                    pos += double.size
+                else:
+                    push(op == OP_TRUE)
+            elif op == OP_PRINT:
+                stack[-1] = ['print', stack[-1]]
+            elif op == OP_IF:
+                true_branch = pop()
+                stack[-1] = ['if', stack[-1], true_branch]
+            elif op == OP_IF_ELSE:
+                false_branch = pop()
+                true_branch = pop()
+                stack[-1] = ['if', stack[-1], true_branch, false_branch]
+            elif op == OP_WHILE or op == OP_PROGRAM:
+                count, pos = read_varint(data, pos)
+                statements = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                if op == OP_WHILE:
+                    stack[-1] = ['while', stack[-1]] + statements
+                else:
+                    push(['calc'] + statements)
+            elif op == OP_ARRAY:
+                count, pos = read_varint(data, pos)
+                values = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                push(['array'] + values)
+            elif op == OP_AT:
+                index = pop()
+                stack[-1] = [stack[-1], 'at', index]
+            else:
+                raise ValueError(f"Unknown opcode {op} at {pos - 1}")
+    except IndexError:
+        raise ValueError("Truncated binary calc program") from None
+    return stack
@@ -0,0 +1,65 @@
+from time import monotonic
+
+# ----------------------------------------------------------------------------
+#  Limits on how long a Calc program may run
+# ----------------------------------------------------------------------------
+
+# A Budget is given to exec_program, which calls its step method before
+# every statement it executes. step only counts down; the number of steps
+# and the clock are checked once every check_every steps, so a budget costs
+# almost nothing while a program is within it. When a limit is passed the
+# run is stopped with BudgetExceeded, which holds the variable table as it
+# was before the statement that was not run. Loops that calc_loops could
+# run in closed form are iterated as usual under a budget, so the steps of
+# a run do not depend on which loops can be shortcut.
+#
+# The same Budget can be used for many runs, exec_program starts it anew
+# every time.
+
+
+class BudgetExceeded(Exception):
+    """Raised when a program runs more steps or longer than its budget allows"""
+
+    def __init__(self, message, env, steps):
+        super().__init__(message)
+        self.env = env
+        self.steps = steps
+
+
+class Budget:
+    """Limits on the number of statements and seconds of one run"""
+
+    def __init__(self, steps=None, seconds=None, check_every=1000):
+        self.steps = steps
+        self.seconds = seconds
+        self.check_every = check_every
+        self.start()
+
+    def start(self):
+        """Starts counting steps and time from zero"""
+        self.used = 0
+        self.deadline = None if self.seconds is None else monotonic() + self.seconds
+        self.refill()
+
+    def refill(self):
+        """Lets the next batch of steps run without checking"""
+        self.batch = self.check_every
+        if self.steps is not None:
+            self.batch = min(self.batch, self.steps - self.used)
+        self.countdown = self.batch
+
+    def step(self, env):
+        """Counts one statement, env is the variable table before it"""
+        self.countdown -= 1
+        if self.countdown < 0:
+            self.check(env)
+
+    def check(self, env):
+        """Raises BudgetExceeded if a limit is passed, else starts a new batch"""
+        self.used += self.batch
+        if self.steps is not None and self.used >= self.steps:
+            raise BudgetExceeded(f"More than {self.steps} steps", env, self.used)
+        if self.deadline is not None and monotonic() > self.deadline:
+            raise BudgetExceeded(f"More than {self.seconds} seconds", env, self.used)
+        self.refill()
+        self.countdown -= 1
@@ -0,0 +1,360 @@
+from typing import NamedTuple
+import struct
+
+from calc import *
+from calc_io import STDIO
+
+# ----------------------------------------------------------------------------
+#  Bytecode compiler and stack based virtual machine for the Calc language
+# ----------------------------------------------------------------------------
+
+# The code is a flat list [op, arg, op, arg, ...]. Instructions without an
+# argument still take two places so that every instruction has the same
+# width. Variables are numbered by their position in names and jumps go to
+# a position in the flat code list.
+
+LOAD_CONST = 0
+LOAD_VAR = 1
+STORE = 2
+ADD = 3
+SUB = 4
+MUL = 5
+DIV = 6
+LESS = 7
+GREATER = 8
+EQUAL = 9
+JUMP = 10
+JUMP_IF_FALSE = 11
+PRINT = 12
+PRINT_VAR = 13
+READ = 14
+
+BINARY_OPCODES = {'+': ADD, '-': SUB, '*': MUL, '/': DIV}
+CONDITION_OPCODES = {'<': LESS, '>': GREATER, '=': EQUAL}
+
+MAGIC = b'CALCBC'
+VERSION = 1
+
+
+class Bytecode(NamedTuple):
+    code: list
+    consts: list
+    names: list
+
+
+# Marks a variable that has no value yet
+UNSET = object()
+
+
+# ----- COMPILER -----
+
+
+def compile_bytecode(lst):
+    """Compiles a calc program into bytecode"""
+    if not is_program(lst):
+        raise SyntaxError("Not a program")
+    bytecode = Bytecode([], [], [])
+    const_index = {}
+    name_index = {}
+
+    def const(value):
+        key = (type(value), value)
+        if key not in const_index:
+            const_index[key] = len(bytecode.consts)
+            bytecode.consts.append(value)
+        return const_index[key]
+
+    def name(variable):
+        if variable not in name_index:
+            name_index[variable] = len(bytecode.names)
+            bytecode.names.append(variable)
+        return name_index[variable]
+
+    def emit(op, arg=0):
+        bytecode.code.extend((op, arg))
+        return len(bytecode.code) - 1
+
+    def emit_expression(expression):
+        if is_variable(expression):
+            emit(LOAD_VAR, name(expression))
+        elif is_binaryexpr(expression):
+            emit_expression(binaryexpr_left(expression))
+            emit_expression(binaryexpr_right(expression))
+            emit(BINARY_OPCODES[binaryexpr_operator(expression)])
+        elif is_constant(expression):
+            emit(LOAD_CONST, const(expression))
+        else:
+            raise SyntaxError(f"Not an expression: {expression!r}")
+
+    def emit_condition(condition):
+        if not is_condition(condition):
+            raise SyntaxError(f"Not a condition: {condition!r}")
+        emit_expression(condition_left(condition))
+        emit_expression(condition_right(condition))
+        emit(CONDITION_OPCODES[condition_operator(condition)])
+
+    def emit_statement(statement):
+        if is_output(statement):
+            expression = output_expression(statement)
+            if is_variable(expression):
+                emit(PRINT_VAR, name(expression))
+            else:
+                emit_expression(expression)
+                emit(PRINT)
+        elif is_assignment(statement):
+            emit_expression(assignment_expression(statement))
+            emit(STORE, name(assignment_variable(statement)))
+        elif is_selection(statement):
+            emit_condition(selection_condition(statement))
+            to_false = emit(JUMP_IF_FALSE)
+            emit_statement(selection_true_branch(statement))
+            if selection_has_false_branch(statement):
+                to_end = emit(JUMP)
+                bytecode.code[to_false] = len(bytecode.code)
+                emit_statement(selection_false_branch(statement))
+                bytecode.code[to_end] = len(bytecode.code)
+            else:
+                bytecode.code[to_false] = len(bytecode.code)
+        elif is_input(statement):
+            emit(READ, name(input_variable(statement)))
+        elif is_repetition(statement):
+            start = len(bytecode.code)
+            emit_condition(repetition_condition(statement))
+            to_end = emit(JUMP_IF_FALSE)
+            for body_statement in repetition_statements(statement):
+                emit_statement(body_statement)
+            emit(JUMP, start)
+            bytecode.code[to_end] = len(bytecode.code)
+        else:
+            raise SyntaxError(f"Not a statement: {statement!r}")
+
+    for statement in program_statements(lst):
+        emit_statement(statement)
+    return bytecode
+
+
+# ----- VIRTUAL MACHINE -----
+
+
+def run_bytecode(bytecode, dic=None, io=STDIO):
+    """Runs compiled bytecode and returns the resulting variable table"""
+    if dic is None:
+        dic = {}
+    code, consts, names = bytecode
+    slots = [dic.get(name, UNSET) for name in names]
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    pc = 0
+    end = len(code)
+    while pc < end:
+        op = code[pc]
+        arg = code[pc + 1]
+        pc += 2
+        if op == LOAD_VAR:
+            value = slots[arg]
+            push(None if value is UNSET else value)
+        elif op == LOAD_CONST:
+            push(consts[arg])
+        elif op == STORE:
+            slots[arg] = pop()
+        elif op == JUMP_IF_FALSE:
+            if not pop():
+                pc = arg
+        elif op == JUMP:
+            pc = arg
+        elif op == ADD:
+            right = pop()
+            stack[-1] = stack[-1] + right
+        elif op == SUB:
+            right = pop()
+            stack[-1] = stack[-1] - right
+        elif op == MUL:
+            right = pop()
+            stack[-1] = stack[-1] * right
+        elif op == DIV:
+            right = pop()
+            if right == 0:
+                raise Exception("Division is by zero")
+            stack[-1] = stack[-1] / right
+        elif op == GREATER:
+            right = pop()
+            stack[-1] = stack[-1] > right
+        elif op == LESS:
+            right = pop()
+            stack[-1] = stack[-1] < right
+        elif op == EQUAL:
+            right = pop()
+            stack[-1] = stack[-1] == right
+        elif op == PRINT_VAR:
+            value = slots[arg]
+            if value is UNSET:
+                io.print(None)
+            else:
+                io.print(names[arg] + " =", + value)
+        elif op == PRINT:
+            io.print(pop())
+        elif op == READ:
+            slots[arg] = int(io.input(f"Enter value for {names[arg]}: "))
+        else:
+            raise ValueError(f"Unknown opcode {op} at {pc - 2}")
+    if not writes_variables(code):
+        return dic
+    result = dic.copy()
+    for name, value in zip(names, slots):
+        if value is not UNSET:
+            result[name] = value
+    return result
+
+
+def writes_variables(code):
+    """Returns whether the bytecode contains any instruction that sets a variable"""
+    return any(op == STORE or op == READ for op in code[::2])
+
+
+# ----- SERIALIZATION -----
+
+# File layout, all integers are unsigned LEB128 varints:
+#   MAGIC, VERSION byte
+#   number of names, then each name as length + UTF-8 bytes
+#   number of constants, then each as a type byte and the value
+#   number of instructions, then each as an opcode byte and its argument
+# Integer constants are zigzag encoded so negative numbers stay small.
+
+INT_CONST = 0
+FLOAT_CONST = 1
+BOOL_CONST = 2
+
+double = struct.Struct('<d')
+
+
+def write_varint(out, n):
+    """Appends a non-negative integer as a varint to a bytearray"""
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(data, pos):
+    """Reads a varint from data at pos and returns the value and the next pos"""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def zigzag(n):
+    """Maps a signed integer to a non-negative one"""
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+
+def unzigzag(n):
+    """Inverse of zigzag"""
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+def bytecode_to_bytes(bytecode):
+    """Encodes bytecode in the compact binary format"""
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+    write_varint(out, len(bytecode.names))
+    for name in bytecode.names:
+        encoded = name.encode('utf-8')
+        write_varint(out, len(encoded))
+        out += encoded
+    write_varint(out, len(bytecode.consts))
+    for value in bytecode.consts:
+        if isinstance(value, bool):
+            out.append(BOOL_CONST)
+            out.append(value)
+        elif isinstance(value, int):
+            out.append(INT_CONST)
+            write_varint(out, zigzag(value))
+        else:
+            out.append(FLOAT_CONST)
+            out += double.pack(value)
+    code = bytecode.code
+    write_varint(out, len(code) // 2)
+    for pc in range(0, len(code), 2):
+        out.append(code[pc])
+        write_varint(out, code[pc + 1])
+    return bytes(out)
+
+
+def bytecode_from_bytes(data):
+    """Decodes bytecode from the compact binary format"""
+    bytecode, pos = read_bytecode(data, 0)
+    if pos != len(data):
+        raise ValueError("Trailing data after bytecode")
+    return bytecode
+
+
+def read_bytecode(data, pos):
+    """Decodes one bytecode at pos and returns it and the position after it"""
+    if data[pos:pos + len(MAGIC)] != MAGIC:
+        raise ValueError("Not calc bytecode")
+    pos += len(MAGIC)
+    if data[pos] != VERSION:
+        raise ValueError(f"Unsupported bytecode version {data[pos]}")
+    pos += 1
+    count, pos = read_varint(data, pos)
+    names = []
+    for _ in range(count):
+        length, pos = read_varint(data, pos)
+        names.append(data[pos:pos + length].decode('utf-8'))
+        pos += length
+    count, pos = read_varint(data, pos)
+    consts = []
+    for _ in range(count):
+        kind = data[pos]
+        pos += 1
+        if kind == INT_CONST:
+            value, pos = read_varint(data, pos)
+            consts.append(unzigzag(value))
+        elif kind == FLOAT_CONST:
+            consts.append(double.unpack_from(data, pos)[0])
+            pos += double.size
+        elif kind == BOOL_CONST:
+            consts.append(bool(data[pos]))
+            pos += 1
+        else:
+            raise ValueError(f"Unknown constant type {kind}")
+    count, pos = read_varint(data, pos)
+    code = []
+    for _ in range(count):
+        code.append(data[pos])
+        arg, pos = read_varint(data, pos + 1)
+        code.append(arg)
+    return Bytecode(code, consts, names), pos
+
+
+def dump_bytecode(bytecodes, file):
+    """Writes a dict of named bytecode programs to a binary file"""
+    out = bytearray()
+    write_varint(out, len(bytecodes))
+    for key, bytecode in bytecodes.items():
+        encoded = key.encode('utf-8')
+        write_varint(out, len(encoded))
+        out += encoded
+        out += bytecode_to_bytes(bytecode)
+    file.write(out)
+
+
+def load_bytecode(file):
+    """Reads a dict of named bytecode programs written by dump_bytecode"""
+    data = file.read()
+    count, pos = read_varint(data, 0)
+    bytecodes = {}
+    for _ in range(count):
+        length, pos = read_varint(data, pos)
+        key = data[pos:pos + length].decode('utf-8')
+        bytecodes[key], pos = read_bytecode(data, pos + length)
+    if pos != len(data):
+        raise ValueError("Trailing data after bytecode library")
+    return bytecodes
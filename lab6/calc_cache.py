@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from hashlib import blake2b
+
+from calc import *
+from calc_binary import program_to_bytes
+from calc_io import CalcIO
+from lab6 import exec_program, is_ndarray
+
+# ----------------------------------------------------------------------------
+#  Cache for the results of whole Calc programs
+# ----------------------------------------------------------------------------
+
+# A Calc program has no side effects other than reading and printing, so
+# running the same program with the same read values and the same starting
+# variables always gives the same variables and the same printed lines.
+# ResultCache.exec_program remembers both for the most recently used runs
+# and, when a run is repeated, prints the lines again and returns a copy of
+# the variables without running the program.
+#
+# Programs that read from the terminal are never cached, since their result
+# depends on what the user types.
+
+
+class ResultCache:
+    """Least recently used cache of program results"""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.results)
+
+    def clear(self):
+        """Forgets all results and resets the counters"""
+        self.results.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def exec_program(self, lst, dic=None, fast=False, inputs=None, output=None):
+        """Runs a calc program like exec_program, reusing an earlier result
+        of the same program with the same inputs and variables"""
+        if dic is None:
+            dic = {}
+        if inputs is None and reads_input(lst):
+            return exec_program(lst, dic, fast, inputs, output)
+        inputs = tuple(inputs) if inputs is not None else ()
+        key = (program_hash(lst), inputs, environment_key(dic))
+        io = CalcIO((), output)
+        if key in self.results:
+            self.hits += 1
+            self.results.move_to_end(key)
+            result, lines = self.results[key]
+            for line in lines:
+                io.print(line)
+            return dic if result is None else copy_result(result)
+        self.misses += 1
+        lines = []
+        try:
+            result = exec_program(lst, dic, fast, inputs, lines)
+        finally:
+            for line in lines:
+                io.print(line)
+        # None means that the caller's own table was returned
+        self.results[key] = (None if result is dic else copy_result(result), lines)
+        if len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+        return result
+
+
+def copy_result(dic):
+    """Returns a copy of a variable table that shares no arrays with it,
+    so changing a returned array does not change the cached one"""
+    return {name: value.copy() if is_ndarray(value) else value
+            for name, value in dic.items()}
+
+
+def program_hash(lst):
+    """Returns a hash of the structure of a program that is the same in
+    every Python process. 1, 1.0 and True give different hashes"""
+    # The binary format is used rather than repr, which fails on very deep
+    # expressions
+    return blake2b(program_to_bytes(lst), digest_size=16).hexdigest()
+
+
+def environment_key(dic):
+    """Returns a hashable key for a variable table"""
+    return tuple(sorted((name, type(value).__name__, value_key(value))
+                        for name, value in dic.items()))
+
+
+def value_key(value):
+    """Returns a hashable key for a value, arrays are not hashable themselves"""
+    if is_ndarray(value):
+        return (value.dtype.str, value.shape, value.tobytes())
+    return value
+
+
+def reads_input(statement):
+    """Returns whether a program or statement contains a read statement"""
+    if is_program(statement):
+        return any(reads_input(s) for s in program_statements(statement))
+    elif is_input(statement):
+        return True
+    elif is_repetition(statement):
+        return any(reads_input(s) for s in repetition_statements(statement))
+    elif is_selection(statement):
+        return reads_input(selection_true_branch(statement)) or (
+            selection_has_false_branch(statement)
+            and reads_input(selection_false_branch(statement)))
+    return False
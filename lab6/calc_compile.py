@@ -0,0 +1,336 @@
+from calc import *
+from calc_io import STDIO
+
+# ----------------------------------------------------------------------------
+#  Closure compiler for the Calc language
+# ----------------------------------------------------------------------------
+
+# The program is walked once and every node is turned into a Python closure.
+# Every variable name is given a slot number when the program is compiled,
+# and a run keeps all variables in one list indexed by those numbers.
+# Statements take the list and the CalcIO to read and print with and
+# update the list in place, expressions and conditions take the list and
+# return a value. Running the compiled program
+# never calls any of the is_* predicates and never copies the variables;
+# they are turned back into a dict once, when the run is finished.
+#
+# Within a run of assignments, reads and prints, a binary expression that
+# appears more than once is only evaluated the first time. Its value is
+# kept in an extra slot that later occurrences read, until one of its
+# variables is assigned or read. An if or while ends such a run.
+#
+# A binary expression becomes a closure that calls the closures of its two
+# sides, so compiling and running an expression recurses once per level of
+# nesting. Unlike the interpreter, compiled programs are therefore limited
+# by Python's recursion limit, and expressions nested more than about a
+# thousand levels deep raise RecursionError.
+
+# Marks a slot for a variable that has no value yet
+UNSET = object()
+
+
+def compile_program(lst):
+    """Compiles a calc program into a function that runs it on a variable table"""
+    if not is_program(lst):
+        raise SyntaxError("Not a program")
+    statements = program_statements(lst)
+    slots = {}
+    body = compile_statements(statements, slots)
+    writes = any(writes_variables(statement) for statement in statements)
+    names = list(slots)
+    variables = [(index, name) for index, name in enumerate(names)
+                 if not is_common_subexpression(name)]
+
+    def run(dic=None, io=STDIO):
+        """Runs the compiled program and returns the resulting variable table"""
+        if dic is None:
+            dic = {}
+        env = [dic.get(name, UNSET) for name in names]
+        body(env, io)
+        if not writes:
+            return dic
+        result = dic.copy()
+        for index, name in variables:
+            if env[index] is not UNSET:
+                result[name] = env[index]
+        return result
+    return run
+
+
+def slot(variable, slots):
+    """Returns the slot number of a variable, giving it one if it has none"""
+    if variable not in slots:
+        slots[variable] = len(slots)
+    return slots[variable]
+
+
+def writes_variables(statement):
+    """Returns whether a statement can change the variable table"""
+    if is_assignment(statement) or is_input(statement):
+        return True
+    elif is_repetition(statement):
+        return any(writes_variables(s) for s in repetition_statements(statement))
+    elif is_selection(statement):
+        return writes_variables(selection_true_branch(statement)) or (
+            selection_has_false_branch(statement)
+            and writes_variables(selection_false_branch(statement)))
+    return False
+
+
+def compile_statements(statements, slots):
+    """Compiles a list of statements into one function"""
+    cse = plan_common_subexpressions(statements, slots)
+    compiled = [compile_statement(statement, slots, cse) for statement in statements]
+    if len(compiled) == 1:
+        return compiled[0]
+
+    def run_statements(env, io):
+        for statement in compiled:
+            statement(env, io)
+    return run_statements
+
+
+def compile_statement(statement, slots, cse=None):
+    """Checks what kind of a statement it is and compiles it.
+    cse is the plan for common subexpressions of the surrounding statements"""
+    if is_output(statement):
+        return compile_output(statement, slots, cse)
+    elif is_assignment(statement):
+        return compile_assignment(statement, slots, cse)
+    elif is_selection(statement):
+        return compile_selection(statement, slots)
+    elif is_input(statement):
+        return compile_input(statement, slots)
+    elif is_repetition(statement):
+        return compile_repetition(statement, slots)
+    raise SyntaxError(f"Not a statement: {statement!r}")
+
+
+def compile_output(statement, slots, cse):
+    """Compiles a print statement"""
+    expression = output_expression(statement)
+    if is_variable(expression):
+        index = slot(expression, slots)
+
+        def run_output(env, io):
+            if env[index] is not UNSET:
+                io.print(expression + " =", + env[index])
+            else:
+                io.print(None)
+        return run_output
+    value = compile_expression(expression, slots, cse)
+
+    def run_output(env, io):
+        io.print(value(env))
+    return run_output
+
+
+def compile_assignment(statement, slots, cse):
+    """Compiles an assignment"""
+    index = slot(assignment_variable(statement), slots)
+    expression = assignment_expression(statement)
+    if is_constant(expression):
+        def run_assignment(env, io):
+            env[index] = expression
+        return run_assignment
+    value = compile_expression(expression, slots, cse)
+
+    def run_assignment(env, io):
+        env[index] = value(env)
+    return run_assignment
+
+
+def compile_input(statement, slots):
+    """Compiles a read statement"""
+    variable = input_variable(statement)
+    index = slot(variable, slots)
+    prompt = f"Enter value for {variable}: "
+
+    def run_input(env, io):
+        env[index] = int(io.input(prompt))
+    return run_input
+
+
+def compile_selection(statement, slots):
+    """Compiles an if statement with one or two branches"""
+    condition = compile_condition(selection_condition(statement), slots)
+    true_branch = compile_statements([selection_true_branch(statement)], slots)
+    if not selection_has_false_branch(statement):
+        def run_selection(env, io):
+            if condition(env):
+                true_branch(env, io)
+        return run_selection
+    false_branch = compile_statements([selection_false_branch(statement)], slots)
+
+    def run_selection(env, io):
+        if condition(env):
+            true_branch(env, io)
+        else:
+            false_branch(env, io)
+    return run_selection
+
+
+def compile_repetition(statement, slots):
+    """Compiles a while loop"""
+    condition = compile_condition(repetition_condition(statement), slots)
+    body = compile_statements(repetition_statements(statement), slots)
+
+    def run_repetition(env, io):
+        while condition(env):
+            body(env, io)
+    return run_repetition
+
+
+def compile_condition(condition, slots):
+    """Compiles a condition into a function returning True or False"""
+    if not is_condition(condition):
+        raise SyntaxError(f"Not a condition: {condition!r}")
+    left = compile_expression(condition_left(condition), slots)
+    right = compile_expression(condition_right(condition), slots)
+    operator = condition_operator(condition)
+    if operator == '>':
+        return lambda env: left(env) > right(env)
+    elif operator == '<':
+        return lambda env: left(env) < right(env)
+    else:
+        return lambda env: left(env) == right(env)
+
+
+def compile_expression(expression, slots, cse=None):
+    """Compiles an expression into a function returning its value"""
+    if is_variable(expression):
+        index = slot(expression, slots)
+
+        def variable_value(env):
+            value = env[index]
+            return None if value is UNSET else value
+        return variable_value
+    elif is_binaryexpr(expression):
+        if cse is None:
+            return compile_binaryexpr(expression, slots)
+        return compile_common_subexpression(expression, slots, cse)
+    elif is_constant(expression):
+        return lambda env: expression
+    raise SyntaxError(f"Not an expression: {expression!r}")
+
+
+def compile_binaryexpr(expression, slots, cse=None):
+    """Compiles a binary expression"""
+    left = compile_expression(binaryexpr_left(expression), slots, cse)
+    right = compile_expression(binaryexpr_right(expression), slots, cse)
+    operator = binaryexpr_operator(expression)
+    if operator == '+':
+        return lambda env: left(env) + right(env)
+    elif operator == '-':
+        return lambda env: left(env) - right(env)
+    elif operator == '*':
+        return lambda env: left(env) * right(env)
+
+    def divide(env):
+        numerator = left(env)
+        denominator = right(env)
+        if denominator == 0:
+            raise Exception("Division is by zero")
+        return numerator / denominator
+    return divide
+
+
+# ----- COMMON SUBEXPRESSIONS -----
+
+
+def is_common_subexpression(name):
+    """Returns whether a slot name is an extra slot holding a shared value"""
+    return isinstance(name, tuple)
+
+
+def plan_common_subexpressions(statements, slots):
+    """Finds the binary expressions that are evaluated more than once before
+    any of their variables change, in the assignments, reads and prints of
+    a list of statements. Returns an iterator with one entry per binary
+    expression, in the order compile_expression meets them: None, or
+    ('store', slot) for the first occurrence and ('load', slot) for the others"""
+    occurrences = []
+    uses = {}
+    current = {}
+
+    def visit(expression):
+        if not is_binaryexpr(expression):
+            return
+        key = expression_key(expression)
+        if key not in current:
+            current[key] = len(uses)
+            uses[current[key]] = 0
+        uses[current[key]] += 1
+        occurrences.append(current[key])
+        visit(binaryexpr_left(expression))
+        visit(binaryexpr_right(expression))
+
+    def invalidate(variable):
+        for key in [key for key in current if variable in key_variables(key)]:
+            del current[key]
+
+    for statement in statements:
+        if is_assignment(statement):
+            visit(assignment_expression(statement))
+            invalidate(assignment_variable(statement))
+        elif is_output(statement):
+            visit(output_expression(statement))
+        elif is_input(statement):
+            invalidate(input_variable(statement))
+        else:
+            current.clear()
+
+    plan = []
+    stored = {}
+    for occurrence in occurrences:
+        if uses[occurrence] < 2:
+            plan.append(None)
+        elif occurrence in stored:
+            plan.append(('load', stored[occurrence]))
+        else:
+            stored[occurrence] = slot(('cse', len(slots)), slots)
+            plan.append(('store', stored[occurrence]))
+    return iter(plan)
+
+
+def expression_key(expression):
+    """Returns a hashable key that is equal for expressions with the same structure"""
+    if is_binaryexpr(expression):
+        return (expression_key(binaryexpr_left(expression)),
+                binaryexpr_operator(expression),
+                expression_key(binaryexpr_right(expression)))
+    # 1, 1.0 and True are equal but must not share a value
+    return (type(expression), expression)
+
+
+def key_variables(key):
+    """Returns the variables used in an expression key"""
+    if len(key) == 3:
+        return key_variables(key[0]) | key_variables(key[2])
+    return {key[1]} if key[0] is str else set()
+
+
+def binary_count(expression):
+    """Returns the number of binary expressions in an expression"""
+    if not is_binaryexpr(expression):
+        return 0
+    return 1 + binary_count(binaryexpr_left(expression)) + binary_count(binaryexpr_right(expression))
+
+
+def compile_common_subexpression(expression, slots, cse):
+    """Compiles a binary expression following the plan for common subexpressions"""
+    action = next(cse)
+    if action is None:
+        return compile_binaryexpr(expression, slots, cse)
+    kind, index = action
+    if kind == 'load':
+        # The parts of a loaded expression are never compiled
+        for _ in range(binary_count(expression) - 1):
+            next(cse)
+        return lambda env: env[index]
+    value = compile_binaryexpr(expression, slots, cse)
+
+    def store(env):
+        env[index] = result = value(env)
+        return result
+    return store
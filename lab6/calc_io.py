@@ -0,0 +1,70 @@
+# ----------------------------------------------------------------------------
+#  Input and output for Calc programs
+# ----------------------------------------------------------------------------
+
+# The interpreters never call input() and print() directly. They call the
+# input and print methods of a CalcIO object, which by default go to the
+# terminal. Give a CalcIO an iterator of input values and an output sink to
+# run programs without touching sys.stdin and sys.stdout.
+#
+# An output sink can be
+#  * a list, every printed line is appended to it (without newline),
+#  * anything with a write method, like a file, or
+#  * a BufferedSink, which collects lines and writes them in batches.
+
+
+class CalcIO:
+    """Where read statements get their values and print statements write"""
+
+    def __init__(self, inputs=None, output=None):
+        self.inputs = iter(inputs) if inputs is not None else None
+        self.output = output
+
+    def input(self, prompt):
+        """Returns the next input value, the prompt is only shown on the terminal"""
+        if self.inputs is None:
+            return input(prompt)
+        try:
+            return next(self.inputs)
+        except StopIteration:
+            raise EOFError("No more input values") from None
+
+    def print(self, *values):
+        """Prints values separated by spaces as one line"""
+        if self.output is None:
+            print(*values)
+        elif isinstance(self.output, list):
+            self.output.append(" ".join(map(str, values)))
+        else:
+            self.output.write(" ".join(map(str, values)) + "\n")
+
+
+class BufferedSink:
+    """Collects printed lines and writes them to a file in batches"""
+
+    def __init__(self, file, batch_size=1000):
+        self.file = file
+        self.batch_size = batch_size
+        self.lines = []
+
+    def write(self, line):
+        """Adds a line, writing the batch when it is full"""
+        self.lines.append(line)
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes all collected lines to the file"""
+        if self.lines:
+            self.file.write("".join(self.lines))
+            self.lines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+
+# Reads from and prints to the terminal
+STDIO = CalcIO()
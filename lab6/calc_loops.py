@@ -0,0 +1,142 @@
+from calc import *
+
+# ----------------------------------------------------------------------------
+#  Closed form evaluation of simple counting loops
+# ----------------------------------------------------------------------------
+
+# A loop like calc4
+#     while n > 0: sum = sum + n; n = n - 1
+# can be run without iterating. analyze_loop recognizes loops where
+#  * the condition compares one counter variable with a constant or with a
+#    variable that the loop does not change, using < or >,
+#  * the body only has assignments, each variable is assigned once,
+#  * the counter is changed by a constant integer every time,
+#  * every other variable is an accumulator, changed by adding or
+#    subtracting a constant, a variable the loop does not change, or the
+#    counter.
+# exec_closed_form then computes the number of iterations and the final
+# values directly. Only integers are handled, since summing floats in a
+# different order can give a different result. Whenever something cannot
+# be proven the functions return None and the loop is run as usual.
+
+
+def exec_closed_form(lst, dic):
+    """Runs a while loop in constant time if possible.
+    Returns the new variable table, or None if the loop must be run as usual"""
+    plan = analyze_loop(lst)
+    if plan is None:
+        return None
+    return run_plan(plan, dic)
+
+
+def analyze_loop(lst):
+    """Returns a plan for evaluating a while loop in closed form, or None"""
+    statements = repetition_statements(lst)
+    if not all(is_assignment(s) for s in statements):
+        return None
+    assigned = [assignment_variable(s) for s in statements]
+    if len(set(assigned)) != len(assigned):
+        return None
+
+    condition = repetition_condition(lst)
+    if not is_condition(condition) or condition_operator(condition) == '=':
+        return None
+    left, operator, right = (condition_left(condition), condition_operator(condition),
+                             condition_right(condition))
+    if is_variable(left) and left in assigned:
+        counter, bound = left, right
+    elif is_variable(right) and right in assigned:
+        # b < n is the same as n > b
+        counter, bound = right, left
+        operator = '>' if operator == '<' else '<'
+    else:
+        return None
+    if not is_invariant(bound, assigned):
+        return None
+
+    step = None
+    counter_position = assigned.index(counter)
+    accumulators = []
+    for position, statement in enumerate(statements):
+        variable = assignment_variable(statement)
+        term = increment(variable, assignment_expression(statement))
+        if term is None:
+            return None
+        sign, amount = term
+        if variable == counter:
+            if not is_integer(amount):
+                return None
+            step = sign * amount
+        elif amount == counter:
+            accumulators.append((variable, sign, amount, position > counter_position))
+        elif is_invariant(amount, assigned):
+            accumulators.append((variable, sign, amount, False))
+        else:
+            return None
+    return counter, step, operator, bound, accumulators
+
+
+def increment(variable, expression):
+    """Returns (sign, amount) if expression is variable + amount or
+    variable - amount, otherwise None"""
+    if not is_binaryexpr(expression):
+        return None
+    left = binaryexpr_left(expression)
+    right = binaryexpr_right(expression)
+    operator = binaryexpr_operator(expression)
+    if operator == '+' and left == variable and right != variable:
+        return 1, right
+    elif operator == '+' and right == variable and left != variable:
+        return 1, left
+    elif operator == '-' and left == variable and right != variable:
+        return -1, right
+    return None
+
+
+def is_invariant(expression, assigned):
+    """Returns whether expression is a constant or a variable the loop does not set"""
+    return is_constant(expression) or (is_variable(expression) and expression not in assigned)
+
+
+def is_integer(value):
+    """Returns whether value is an int (and not a bool)"""
+    return type(value) is int
+
+
+def run_plan(plan, dic):
+    """Computes the result of a loop from a plan, or None if the values do not allow it"""
+    counter, step, operator, bound, accumulators = plan
+    start = dic.get(counter)
+    limit = dic.get(bound) if is_variable(bound) else bound
+    if not (is_integer(start) and is_integer(limit)):
+        return None
+    if operator == '>':
+        if not start > limit:
+            return dic
+        if step >= 0:
+            # Never terminates, leave that to the interpreter
+            return None
+        iterations = (start - limit - step - 1) // -step
+    else:
+        if not start < limit:
+            return dic
+        if step <= 0:
+            return None
+        iterations = (limit - start + step - 1) // step
+
+    result = dic.copy()
+    for variable, sign, amount, after_counter in accumulators:
+        value = dic.get(variable)
+        if amount == counter:
+            first = start + step if after_counter else start
+            total = iterations * first + step * iterations * (iterations - 1) // 2
+        else:
+            total = dic.get(amount) if is_variable(amount) else amount
+            if not is_integer(total):
+                return None
+            total = total * iterations
+        if not is_integer(value):
+            return None
+        result[variable] = value + sign * total
+    result[counter] = start + step * iterations
+    return result
@@ -0,0 +1,261 @@
+from calc import *
+
+# ----------------------------------------------------------------------------
+#  Optimizer for Calc programs
+# ----------------------------------------------------------------------------
+
+# optimize_program returns a new program in the same list form that gives
+# the same variables and output as the original. It
+#  * folds binary expressions whose operands are constants,
+#  * removes identities such as x * 1 and x + 0,
+#  * replaces if statements with a constant condition by the branch taken
+#    and removes while loops whose condition is constant and false,
+#  * removes assignments whose value is overwritten before it is read.
+# The variable table is the result of a program, so every variable is
+# considered read when the program ends. Divisions by zero are never folded
+# and assignments that divide, index an array or contain an array constant
+# are never removed, so their errors are still raised when the program
+# runs. Errors from doing arithmetic on variables without a value, or on
+# variables holding arrays of different lengths, are not kept.
+
+
+def optimize_program(lst):
+    """Returns an optimized copy of a calc program"""
+    if not is_program(lst):
+        raise SyntaxError("Not a program")
+    statements = optimize_statements(program_statements(lst))
+    if statements:
+        statements, _ = remove_dead_stores(statements, assigned_variables(statements))
+    if not statements:
+        # Everything was an if or while that never runs, but a program must
+        # have at least one statement
+        statements = program_statements(lst)[:1]
+    return ['calc'] + statements
+
+
+# ----- FOLDING AND SIMPLIFICATION -----
+
+
+def optimize_statements(statements):
+    """Optimizes a list of statements, dropping the ones that do nothing"""
+    result = []
+    for statement in statements:
+        optimized = optimize_statement(statement)
+        if optimized is not None:
+            result.append(optimized)
+    return result
+
+
+def optimize_statement(statement):
+    """Optimizes one statement, returns None if it can be removed"""
+    if is_assignment(statement):
+        return ['set', assignment_variable(statement),
+                optimize_expression(assignment_expression(statement))]
+    elif is_output(statement):
+        expression = output_expression(statement)
+        optimized = optimize_expression(expression)
+        if is_variable(optimized) and not is_variable(expression):
+            # print writes "x = value" for a variable but only the value for
+            # an expression, so e.g. x * 1 must not become x
+            optimized = expression
+        return ['print', optimized]
+    elif is_input(statement):
+        return list(statement)
+    elif is_selection(statement):
+        return optimize_selection(statement)
+    elif is_repetition(statement):
+        condition = optimize_condition(repetition_condition(statement))
+        if condition_value(condition) is False:
+            return None
+        body = optimize_statements(repetition_statements(statement))
+        if not body:
+            body = list(repetition_statements(statement))
+        return ['while', condition] + body
+    raise SyntaxError(f"Not a statement: {statement!r}")
+
+
+def optimize_selection(statement):
+    """Optimizes an if statement, taking the branch directly if the condition is constant"""
+    condition = optimize_condition(selection_condition(statement))
+    true_branch = selection_true_branch(statement)
+    false_branch = (selection_false_branch(statement)
+                    if selection_has_false_branch(statement) else None)
+    value = condition_value(condition)
+    if value is True:
+        return optimize_statement(true_branch)
+    elif value is False:
+        return optimize_statement(false_branch) if false_branch else None
+    optimized_true = optimize_statement(true_branch)
+    optimized_false = optimize_statement(false_branch) if false_branch else None
+    if optimized_true is None:
+        # A branch that does nothing must still be a statement
+        optimized_true = list(true_branch)
+    if optimized_false is None:
+        return ['if', condition, optimized_true]
+    return ['if', condition, optimized_true, optimized_false]
+
+
+def optimize_condition(condition):
+    """Optimizes both sides of a condition"""
+    if not is_condition(condition):
+        raise SyntaxError(f"Not a condition: {condition!r}")
+    return [optimize_expression(condition_left(condition)),
+            condition_operator(condition),
+            optimize_expression(condition_right(condition))]
+
+
+def condition_value(condition):
+    """Returns True or False for a condition between constants, otherwise None"""
+    left = condition_left(condition)
+    right = condition_right(condition)
+    if not (is_constant(left) and is_constant(right)):
+        return None
+    operator = condition_operator(condition)
+    if operator == '<':
+        return left < right
+    elif operator == '>':
+        return left > right
+    return left == right
+
+
+def optimize_expression(expression):
+    """Folds constants and removes identities in an expression"""
+    if not is_binaryexpr(expression):
+        return expression
+    left = optimize_expression(binaryexpr_left(expression))
+    right = optimize_expression(binaryexpr_right(expression))
+    operator = binaryexpr_operator(expression)
+    if is_constant(left) and is_constant(right):
+        if operator == '+':
+            return left + right
+        elif operator == '-':
+            return left - right
+        elif operator == '*':
+            return left * right
+        elif right != 0:
+            return left / right
+    elif operator == '+' and is_integer_zero(right):
+        return left
+    elif operator == '+' and is_integer_zero(left):
+        return right
+    elif operator == '-' and is_integer_zero(right):
+        return left
+    elif operator == '*' and is_integer_one(right):
+        return left
+    elif operator == '*' and is_integer_one(left):
+        return right
+    return [left, operator, right]
+
+
+def is_integer_zero(p):
+    """Returns whether p is the integer constant 0"""
+    return type(p) is int and p == 0
+
+
+def is_integer_one(p):
+    """Returns whether p is the integer constant 1"""
+    return type(p) is int and p == 1
+
+
+# ----- DEAD STORES -----
+
+
+def remove_dead_stores(statements, live, remove=True):
+    """Removes assignments that are overwritten before they are read.
+    live is the set of variables read after the statements.
+    Returns the new statements and the variables read before them.
+    With remove=False nothing is removed and only the variables are found"""
+    result = []
+    for statement in reversed(statements):
+        if is_assignment(statement):
+            variable = assignment_variable(statement)
+            expression = assignment_expression(statement)
+            if remove and variable not in live and not may_raise(expression):
+                continue
+            live = (live - {variable}) | used_variables(expression)
+        elif is_input(statement):
+            live = live - {input_variable(statement)}
+        elif is_output(statement):
+            live = live | used_variables(output_expression(statement))
+        elif is_selection(statement):
+            live = live_before_selection(statement, live)
+        elif is_repetition(statement):
+            statement, live = remove_dead_stores_in_loop(statement, live, remove)
+        result.append(statement)
+    result.reverse()
+    return result, live
+
+
+def live_before_selection(statement, live):
+    """Returns the variables read before an if statement.
+    Branches are single statements and are left unchanged"""
+    branches = [selection_true_branch(statement)]
+    if selection_has_false_branch(statement):
+        branches.append(selection_false_branch(statement))
+    else:
+        branches.append(None)
+    live_before = used_variables(selection_condition(statement))
+    for branch in branches:
+        if branch is None:
+            live_before = live_before | live
+        else:
+            live_before = live_before | remove_dead_stores([branch], live, False)[1]
+    return live_before
+
+
+def remove_dead_stores_in_loop(statement, live, remove=True):
+    """Removes dead stores in the body of a while loop"""
+    condition = repetition_condition(statement)
+    body = repetition_statements(statement)
+    # The variables live at the top of the loop, found by iterating until
+    # nothing changes
+    head = live | used_variables(condition)
+    while True:
+        _, body_live = remove_dead_stores(body, head, remove)
+        new_head = head | body_live
+        if new_head == head:
+            break
+        head = new_head
+    new_body, _ = remove_dead_stores(body, head, remove)
+    if not new_body:
+        new_body = list(body)
+    return ['while', condition] + new_body, head
+
+
+def used_variables(p):
+    """Returns the set of variables read by an expression or condition"""
+    if is_variable(p):
+        return {p}
+    elif is_array(p):
+        return set()
+    elif isinstance(p, list) and len(p) == 3:
+        return used_variables(p[0]) | used_variables(p[2])
+    return set()
+
+
+def assigned_variables(statements):
+    """Returns the set of variables that can be set by the statements"""
+    result = set()
+    for statement in statements:
+        if is_assignment(statement):
+            result.add(assignment_variable(statement))
+        elif is_input(statement):
+            result.add(input_variable(statement))
+        elif is_selection(statement):
+            result |= assigned_variables([selection_true_branch(statement)])
+            if selection_has_false_branch(statement):
+                result |= assigned_variables([selection_false_branch(statement)])
+        elif is_repetition(statement):
+            result |= assigned_variables(repetition_statements(statement))
+    return result
+
+
+def may_raise(expression):
+    """Returns whether an expression contains a division, an indexing or
+    an array, which can raise an error for some values"""
+    if is_array(expression) or is_indexing(expression):
+        return True
+    return is_binaryexpr(expression) and (
+        binaryexpr_operator(expression) == '/'
+        or may_raise(binaryexpr_left(expression))
+        or may_raise(binaryexpr_right(expression)))
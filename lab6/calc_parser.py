@@ -0,0 +1,165 @@
+import re
+from ast import literal_eval
+from io import StringIO
+from operator import itemgetter
+
+from calc import *
+
+# ----------------------------------------------------------------------------
+#  Parser for Calc programs written as text
+# ----------------------------------------------------------------------------
+
+# The text syntax is the one described by the grammar in calc.py, the same
+# bracketed lists that are written in Python, e.g.
+#     ['calc', ['read', 'n'], ['print', ['n', '*', 2]]]
+# The tokenizer reads the text in chunks, so a file holding many programs
+# (one after another, separated by whitespace) can be parsed without
+# reading all of it into memory first.
+#
+# Tokens are found with one regular expression. Every match fills exactly
+# one of its groups: punctuation, a string in single or double quotes, a
+# number, True/False, or any other character, which is an error.
+
+TOKEN = re.compile(r"""\s*(?:
+      ([\[\],])
+    | '([^'\\\n]*(?:\\.[^'\\\n]*)*)'
+    | "([^"\\\n]*(?:\\.[^"\\\n]*)*)"
+    | ([-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)
+    | (True|False)
+    | (\S)
+)""", re.VERBOSE)
+
+ERROR_GROUP = 6
+error_text = itemgetter(ERROR_GROUP - 1)
+
+CHUNK_SIZE = 1 << 16
+
+
+def parse_program(text):
+    """Parses the text of one calc program into its list form"""
+    programs = list(iter_programs(StringIO(text)))
+    if len(programs) != 1:
+        raise SyntaxError(f"Expected one program, found {len(programs)}")
+    return programs[0]
+
+
+def read_program(file):
+    """Reads one calc program from a text file"""
+    programs = list(iter_programs(file))
+    if len(programs) != 1:
+        raise SyntaxError(f"Expected one program, found {len(programs)}")
+    return programs[0]
+
+
+def iter_programs(file, chunk_size=CHUNK_SIZE):
+    """Yields every program in a text file, reading it chunk by chunk"""
+    stack = []
+    current = None
+    # Whether the next token in the current list must be ',' or ']'
+    after_item = False
+    for tokens in tokenize(file, chunk_size):
+        for punctuation, single, double, number, word, error in tokens:
+            if punctuation == '[':
+                if current is not None:
+                    if after_item:
+                        raise SyntaxError("Expected ',' or ']' before '['")
+                    stack.append(current)
+                current = []
+                after_item = False
+            elif punctuation == ']':
+                if current is None:
+                    raise SyntaxError("Unexpected ']'")
+                finished = current
+                if stack:
+                    current = stack.pop()
+                    current.append(finished)
+                    after_item = True
+                else:
+                    if not is_program(finished):
+                        raise SyntaxError(f"Not a program: {describe(finished)}")
+                    yield finished
+                    current = None
+            elif punctuation == ',':
+                if current is None or not after_item:
+                    raise SyntaxError("Unexpected ','")
+                after_item = False
+            else:
+                if current is None:
+                    raise SyntaxError("Expected '[' to start a program")
+                if after_item:
+                    raise SyntaxError("Expected ',' or ']' between items")
+                if number:
+                    if '.' in number or 'e' in number or 'E' in number:
+                        current.append(float(number))
+                    else:
+                        current.append(int(number))
+                elif word:
+                    current.append(word == 'True')
+                elif double:
+                    current.append(unescape(double, '"'))
+                else:
+                    current.append(unescape(single, "'"))
+                after_item = True
+    if current is not None:
+        raise SyntaxError("Unexpected end of text, missing ']'")
+
+
+def unescape(text, quote):
+    """Returns the value of a string literal body"""
+    if '\\' in text:
+        return literal_eval(quote + text + quote)
+    return text
+
+
+def describe(p, width=40):
+    """Returns a short text for p to use in error messages"""
+    text = repr(p)
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+
+def tokenize(file, chunk_size=CHUNK_SIZE):
+    """Yields lists of token tuples, one list per chunk of the file.
+    A chunk is cut after its last '[', ']' or ',' so no token is split; if
+    that was inside a string the cut is retried with more text, any other
+    bad character raises SyntaxError at once"""
+    rest = ''
+    offset = 0
+    while True:
+        chunk = file.read(chunk_size)
+        text = rest + chunk
+        if not chunk:
+            tokens = TOKEN.findall(text)
+            check_tokens(tokens, text, offset)
+            yield tokens
+            return
+        cut = max(text.rfind(']'), text.rfind(','), text.rfind('[')) + 1
+        if cut == 0:
+            rest = text
+            continue
+        tokens = TOKEN.findall(text, 0, cut)
+        if any(map(error_text, tokens)):
+            error = first_error(text, cut)
+            if error.group(ERROR_GROUP) in '\'"' and '\n' not in text[error.end():cut]:
+                # A string that goes on after the cut, try again with more text
+                rest = text
+                continue
+            check_tokens(tokens, text[:cut], offset)
+        yield tokens
+        rest = text[cut:]
+        offset += cut
+
+
+def check_tokens(tokens, text, offset):
+    """Raises SyntaxError with the position of the first bad character"""
+    if any(map(error_text, tokens)):
+        match = first_error(text, len(text))
+        position = offset + match.start(ERROR_GROUP)
+        raise SyntaxError(f"Unexpected {match.group(ERROR_GROUP)!r} "
+                          f"at character {position}")
+
+
+def first_error(text, end):
+    """Returns the match of the first bad character in text[:end]"""
+    for match in TOKEN.finditer(text, 0, end):
+        if match.group(ERROR_GROUP):
+            return match
@@ -0,0 +1,47 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from calc_bytecode import Bytecode, compile_bytecode, run_bytecode
+from calc_bytecode import bytecode_to_bytes, bytecode_from_bytes
+from calc_io import CalcIO
+
+# ----------------------------------------------------------------------------
+#  Running many Calc programs in parallel
+# ----------------------------------------------------------------------------
+
+# run_programs is the counterpart of exec_program for large batches of
+# independent programs. Every program is compiled to bytecode in the calling
+# process, so syntax errors show up before any work is sent away, and is
+# sent to the worker processes in the compact binary bytecode format. The
+# workers run it headless with the given read values and send back the
+# variable table and the printed lines.
+
+
+def run_programs(programs, inputs=None, workers=None, chunksize=None):
+    """Runs calc programs in worker processes.
+    programs are in the list form or already compiled Bytecode, inputs a
+    list with the read values for each program (None means no reads).
+    Returns a list of (variable table, printed lines) in the same order"""
+    shipped = [bytecode_to_bytes(p if isinstance(p, Bytecode) else compile_bytecode(p))
+               for p in programs]
+    if inputs is None:
+        inputs = [()] * len(shipped)
+    elif len(inputs) != len(shipped):
+        raise ValueError("Need one list of inputs per program")
+    jobs = zip(shipped, inputs)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(shipped) <= 1:
+        return [run_shipped(job) for job in jobs]
+    if chunksize is None:
+        chunksize = max(1, len(shipped) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_shipped, jobs, chunksize=chunksize))
+
+
+def run_shipped(job):
+    """Runs one program sent to a worker and returns its variables and output"""
+    data, inputs = job
+    output = []
+    result = run_bytecode(bytecode_from_bytes(data), {}, CalcIO(inputs or (), output))
+    return result, output
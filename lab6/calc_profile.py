@@ -0,0 +1,164 @@
+import sys
+from time import perf_counter
+
+from calc import *
+from calc_ast import format_path
+from calc_io import CalcIO, STDIO
+from calc_loops import exec_closed_form
+from lab6 import exec_statement, eval_condition
+
+# ----------------------------------------------------------------------------
+#  Profiler for Calc programs
+# ----------------------------------------------------------------------------
+
+# profile_program runs a program like exec_program, but times every
+# statement it executes. Statements are identified by their path in the
+# list form, e.g. program[3][2] is the first statement in the body of the
+# while loop that is the third statement of the program. The time of an if
+# or while includes the statements inside it.
+#
+# It also counts how many times eval_expression is called (once for every
+# expression a statement evaluates, plus once for every constant, variable
+# or array inside a binary expression) and how many times
+# the variable table is copied (once per assignment and read). Both are
+# computed from the size of the expressions involved, so that counting does
+# not slow down the interpreter itself.
+#
+# Loops are run in closed form when exec_program would, see calc_loops.
+# Such a loop is counted as one statement without any counts for its body,
+# and is marked in the report. Its result is one copy of the variables.
+# Like exec_program, a profiled run can be given a Budget.
+
+
+class Profile:
+    """Execution counts and times per statement of one or more runs"""
+
+    def __init__(self):
+        self.counts = {}
+        self.times = {}
+        self.statements = {}
+        self.expression_evaluations = 0
+        self.environment_copies = 0
+        # Paths of the loops that were run in closed form
+        self.closed_form = set()
+
+    def record(self, path, statement, elapsed):
+        """Records one execution of the statement at path"""
+        if path in self.counts:
+            self.counts[path] += 1
+            self.times[path] += elapsed
+        else:
+            self.counts[path] = 1
+            self.times[path] = elapsed
+            self.statements[path] = statement
+
+    def ranked(self):
+        """Returns the paths sorted by total time, slowest first"""
+        return sorted(self.times, key=self.times.get, reverse=True)
+
+    def report(self, file=None, limit=20):
+        """Prints the statements that took the most time"""
+        file = file or sys.stdout
+        print(f"{'total':>10} {'count':>9} {'per call':>10}  statement", file=file)
+        for path in self.ranked()[:limit]:
+            total = self.times[path]
+            count = self.counts[path]
+            mark = " (closed form)" if path in self.closed_form else ""
+            print(f"{total:>9.4f}s {count:>9} {total / count * 1e6:>8.2f}us"
+                  f"  {format_path(path)} {describe(self.statements[path])}{mark}",
+                  file=file)
+        print(f"eval_expression calls: {self.expression_evaluations}", file=file)
+        print(f"environment copies: {self.environment_copies}", file=file)
+
+
+def describe(statement, width=50):
+    """Returns a short description of a statement"""
+    text = repr(statement)
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+
+def expression_size(expression):
+    """Returns how many calls to eval_expression evaluating expression makes"""
+    # eval_binaryexpr evaluates the binary expressions inside another one
+    # with its own stack, only the other parts go through eval_expression
+    calls = 1
+    todo = [expression]
+    while todo:
+        p = todo.pop()
+        if is_binaryexpr(p):
+            parts = [binaryexpr_left(p), binaryexpr_right(p)]
+            calls += sum(not is_binaryexpr(part) for part in parts)
+        elif is_indexing(p):
+            parts = [indexing_array(p), indexing_index(p)]
+            calls += 2
+        else:
+            continue
+        todo += parts
+    return calls
+
+
+def condition_size(condition):
+    """Returns how many calls to eval_expression evaluating condition makes"""
+    return expression_size(condition_left(condition)) + expression_size(condition_right(condition))
+
+
+def profile_program(lst, dic=None, inputs=None, output=None, profile=None,
+                    budget=None):
+    """Runs a calc program like exec_program and returns the variable table
+    and a Profile, which is added to if given"""
+    if dic is None:
+        dic = {}
+    if profile is None:
+        profile = Profile()
+    io = STDIO if inputs is None and output is None else CalcIO(inputs, output)
+    if not is_program(lst):
+        raise SyntaxError("Not a program")
+    if budget is not None:
+        budget.start()
+    for index, statement in enumerate(program_statements(lst), 1):
+        dic = profile_statement(statement, dic, io, (index,), profile, budget)
+    return dic, profile
+
+
+def profile_statement(lst, dic, io, path, profile, budget=None):
+    """Runs one statement like exec_statement and records it in profile"""
+    if budget is not None:
+        budget.step(dic)
+    start = perf_counter()
+    if is_repetition(lst):
+        closed_form = None if budget is not None else exec_closed_form(lst, dic)
+        if closed_form is not None:
+            if closed_form is not dic:
+                profile.environment_copies += 1
+            profile.closed_form.add(path)
+            dic = closed_form
+        else:
+            condition = repetition_condition(lst)
+            size = condition_size(condition)
+            profile.expression_evaluations += size
+            while eval_condition(condition, dic):
+                for index, statement in enumerate(repetition_statements(lst), 2):
+                    dic = profile_statement(statement, dic, io, path + (index,),
+                                            profile, budget)
+                profile.expression_evaluations += size
+    elif is_selection(lst):
+        profile.expression_evaluations += condition_size(selection_condition(lst))
+        if eval_condition(selection_condition(lst), dic):
+            dic = profile_statement(selection_true_branch(lst), dic, io, path + (2,),
+                                    profile, budget)
+        elif selection_has_false_branch(lst):
+            dic = profile_statement(selection_false_branch(lst), dic, io, path + (3,),
+                                    profile, budget)
+    else:
+        if is_assignment(lst):
+            profile.expression_evaluations += expression_size(assignment_expression(lst))
+            profile.environment_copies += 1
+        elif is_input(lst):
+            profile.environment_copies += 1
+        elif is_output(lst):
+            expression = output_expression(lst)
+            if not (is_variable(expression) and expression in dic):
+                profile.expression_evaluations += expression_size(expression)
+        dic = exec_statement(lst, dic, io)
+    profile.record(path, lst, perf_counter() - start)
+    return dic
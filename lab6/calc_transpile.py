@@ -0,0 +1,229 @@
+import marshal
+import math
+import os
+import sys
+from collections import OrderedDict
+
+from calc_ast import *
+from calc_cache import program_hash
+from calc_io import STDIO
+
+# ----------------------------------------------------------------------------
+#  Translating Calc programs to Python
+# ----------------------------------------------------------------------------
+
+# transpile turns a calc program into the source of a Python function
+# calc_program(dic, io). Every variable becomes a local variable v0, v1, ...
+# and while and if become Python's own while and if, so running it is
+# running ordinary Python code. A variable without a value holds UNSET, and
+# is only checked for when it is read at a point where it may not have been
+# assigned yet. Very deep expressions are split up with temporary locals
+# t0, t1, ... since the Python parser only allows limited nesting.
+#
+# compile_python compiles the source once per program and keeps the code
+# objects of the CODE_CACHE_SIZE most recently used programs in memory.
+# With a cache_dir they are also stored on disk with marshal, so other
+# processes can skip transpiling and compiling.
+
+TRANSPILE_VERSION = 1
+MAX_DEPTH = 50
+
+# Marks a variable that has no value yet
+UNSET = object()
+
+CODE_CACHE = OrderedDict()
+CODE_CACHE_SIZE = 256
+
+
+def div(left, right):
+    """Divides like exec_program"""
+    if right == 0:
+        raise Exception("Division is by zero")
+    return left / right
+
+
+def compile_python(lst, cache_dir=None):
+    """Compiles a calc program to Python code and returns a function
+    run(dic=None, io=STDIO) that runs it like exec_program"""
+    key = program_hash(lst)
+    code = CODE_CACHE.get(key)
+    if code is None:
+        code = load_code(lst, key, cache_dir)
+        CODE_CACHE[key] = code
+        if len(CODE_CACHE) > CODE_CACHE_SIZE:
+            CODE_CACHE.popitem(last=False)
+    else:
+        CODE_CACHE.move_to_end(key)
+    namespace = {'UNSET': UNSET, 'div': div}
+    exec(code, namespace)
+    calc_program = namespace['calc_program']
+
+    def run(dic=None, io=STDIO):
+        """Runs the compiled program and returns the resulting variable table"""
+        return calc_program({} if dic is None else dic, io)
+    return run
+
+
+def load_code(lst, key, cache_dir):
+    """Returns the code object of a program, from cache_dir if it is there"""
+    if cache_dir is None:
+        return compile(transpile(lst), f"<calc {key}>", 'exec')
+    path = os.path.join(cache_dir, f"{key}-{TRANSPILE_VERSION}"
+                                   f".{sys.implementation.cache_tag}.bin")
+    try:
+        with open(path, 'rb') as file:
+            return marshal.load(file)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    code = compile(transpile(lst), f"<calc {key}>", 'exec')
+    os.makedirs(cache_dir, exist_ok=True)
+    # Written to another file first so no process reads half a file
+    temporary = f"{path}.{os.getpid()}"
+    with open(temporary, 'wb') as file:
+        marshal.dump(code, file)
+    os.replace(temporary, path)
+    return code
+
+
+def transpile(lst):
+    """Returns the source of a Python function calc_program(dic, io) that
+    runs a calc program, which is validated first"""
+    program = validate_program(lst)
+    transpiler = Transpiler()
+    body = transpiler.statements(program.statements, 1)
+    names = list(transpiler.names)
+    lines = ["def calc_program(dic, io):"]
+    for name in names:
+        lines.append(f"    {transpiler.names[name]} = dic.get({name!r}, UNSET)")
+    lines += body
+    if program.writes:
+        values = ", ".join(transpiler.names[name] for name in names)
+        lines += ["    result = dic.copy()",
+                  f"    for name, value in zip({tuple(names)!r}, ({values},)):",
+                  "        if value is not UNSET:",
+                  "            result[name] = value",
+                  "    return result"]
+    else:
+        lines.append("    return dic")
+    return "\n".join(lines) + "\n"
+
+
+class Transpiler:
+    """Keeps track of the locals while translating one program"""
+
+    def __init__(self):
+        self.names = {}
+        self.temporaries = 0
+        # Variables that certainly have a value at the current point
+        self.assigned = set()
+
+    def local(self, variable):
+        """Returns the local variable for a calc variable"""
+        if variable not in self.names:
+            self.names[variable] = f"v{len(self.names)}"
+        return self.names[variable]
+
+    def statements(self, statements, level):
+        lines = []
+        for statement in statements:
+            lines += self.statement(statement, level)
+        return lines
+
+    def statement(self, node, level):
+        indent = "    " * level
+        tag = node.tag
+        if tag == ASSIGNMENT:
+            lines = []
+            value = self.expression(node.expression, lines)
+            lines.append(f"{self.local(node.variable)} = {value}")
+            self.assigned.add(node.variable)
+        elif tag == INPUT:
+            prompt = f"Enter value for {node.variable}: "
+            lines = [f"{self.local(node.variable)} = int(io.input({prompt!r}))"]
+            self.assigned.add(node.variable)
+        elif tag == OUTPUT:
+            expression = node.expression
+            if expression.tag == VARIABLE:
+                local = self.local(expression.name)
+                printed = f"io.print({expression.name + ' ='!r}, +{local})"
+                if expression.name not in self.assigned:
+                    printed = f"io.print(None) if {local} is UNSET else {printed}"
+                lines = [printed]
+            else:
+                lines = []
+                lines.append(f"io.print({self.expression(expression, lines)})")
+        elif tag == SELECTION:
+            lines = []
+            lines.append(f"if {self.condition(node.condition, lines)}:")
+            before = set(self.assigned)
+            lines += self.statement(node.true_branch, 1)
+            true_assigned = self.assigned
+            self.assigned = set(before)
+            if node.false_branch is not None:
+                lines.append("else:")
+                lines += self.statement(node.false_branch, 1)
+            self.assigned &= true_assigned
+        else:
+            lines = []
+            condition = self.condition(node.condition, lines)
+            before = set(self.assigned)
+            if lines:
+                # The condition needs temporaries, which are computed anew
+                # before every test
+                lines = ["while True:"] + ["    " + line for line in lines]
+                lines.append(f"    if not {condition}:")
+                lines.append("        break")
+            else:
+                lines = [f"while {condition}:"]
+            lines += self.statements(node.statements, 1)
+            self.assigned = before
+        return [indent + line for line in lines]
+
+    def condition(self, node, lines):
+        """Returns the source of a condition, adding any temporaries to lines"""
+        left = self.expression(node.left, lines)
+        right = self.expression(node.right, lines)
+        operator = '==' if node.operator == '=' else node.operator
+        return f"{left} {operator} {right}"
+
+    def expression(self, node, lines):
+        """Returns the source of an expression, adding any temporaries to lines"""
+        # Uses a stack of its own like eval_node_binaryexpr, with the source
+        # and nesting depth of every finished part
+        values = []
+        todo = [node]
+        while todo:
+            node = todo.pop()
+            if isinstance(node, str):
+                right, right_depth = values.pop()
+                left, left_depth = values.pop()
+                if node == '/':
+                    source = f"div({left}, {right})"
+                else:
+                    source = f"({left} {node} {right})"
+                depth = max(left_depth, right_depth) + 1
+                if depth > MAX_DEPTH:
+                    temporary = f"t{self.temporaries}"
+                    self.temporaries += 1
+                    lines.append(f"{temporary} = {source}")
+                    source, depth = temporary, 0
+                values.append((source, depth))
+            elif node.tag == BINARYEXPR:
+                todo.append(node.operator)
+                todo.append(node.right)
+                todo.append(node.left)
+            elif node.tag == VARIABLE:
+                local = self.local(node.name)
+                if node.name not in self.assigned:
+                    local = f"(None if {local} is UNSET else {local})"
+                values.append((local, 0))
+            else:
+                values.append((constant_source(node.value), 0))
+        return values[0][0]
+
+
+def constant_source(value):
+    """Returns the source of a constant"""
+    if isinstance(value, float) and not math.isfinite(value):
+        return f"float({repr(value)!r})"
+    return repr(value)
@@ -1,29 +1,55 @@
-ifrom calc import *
+from calc import *
+from calc_compile import compile_program
+# Not used here, imported so callers of exec_program can get them from lab6
+from calc_budget import Budget, BudgetExceeded
+from calc_io import CalcIO, STDIO
+from calc_loops import exec_closed_form
 
-def exec_program(lst, dic=None):
-    """Runs a calc program if it has the correct syntax"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def exec_program(lst, dic=None, fast=False, inputs=None, output=None, budget=None):
+    """Runs a calc program if it has the correct syntax.
+    With fast=True the program is compiled so that variables live in numbered
+    slots during the run instead of the table being copied on every assignment.
+    inputs is an iterable of values for read statements and output a list,
+    file or BufferedSink for print statements, by default the terminal is used.
+    budget is a Budget limiting the steps and time of the run, it raises
+    BudgetExceeded when passed. A budget is only kept by the interpreter,
+    so fast is ignored when one is given, and so it is for programs with
+    arrays. The interpreter handles expressions of any depth, fast mode
+    keeps Python's recursion limit"""
     if dic is None:
         dic = {}
+    io = STDIO if inputs is None and output is None else CalcIO(inputs, output)
+    if fast and budget is None and not uses_arrays(lst):
+        return compile_program(lst)(dic, io)
+    if budget is not None:
+        budget.start()
     if is_program(lst):
         statements = program_statements(lst)
         for statement in statements:
-            dic = exec_statement(statement, dic)
+            dic = exec_statement(statement, dic, io, budget)
         return dic
     else:
         raise SyntaxError("Not a program")
 
-def exec_statement(lst, dic):
+def exec_statement(lst, dic, io=STDIO, budget=None):
     """Checks what kind of a statement it is and runs the corresponding function"""
+    if budget is not None:
+        budget.step(dic)
     if is_output(lst):
-        return exec_output(lst, dic)
+        return exec_output(lst, dic, io)
     elif is_assignment(lst):
         return exec_assignment(lst, dic)
     elif is_selection(lst):
-        return exec_selection(lst, dic)
+        return exec_selection(lst, dic, io, budget)
     elif is_input(lst):
-        return exec_input(lst, dic)
+        return exec_input(lst, dic, io)
     elif is_repetition(lst):
-        return exec_repetition(lst, dic)
+        return exec_repetition(lst, dic, io, budget)
 
 
 def eval_expression(lst, dic):
@@ -34,47 +60,131 @@ def eval_expression(lst, dic):
         return eval_binaryexpr(lst, dic)
     elif is_constant(lst):
         return lst
+    elif is_array(lst):
+        return eval_array(lst)
+    elif is_indexing(lst):
+        return eval_indexing(lst, dic)
     return dic
     
 
-def exec_output(print_list, dic):
+def exec_output(print_list, dic, io=STDIO):
     """Prints a given expression"""
-    if output_expression(print_list) in dic:
+    if is_variable(output_expression(print_list)) and output_expression(print_list) in dic:
         y = dic.get((output_expression(print_list)))
-        print(output_expression(print_list) + " =", + y)
+        io.print(output_expression(print_list) + " =", + y)
     else:
-        print(eval_expression(output_expression(print_list), dic))
+        io.print(eval_expression(output_expression(print_list), dic))
     return dic
 
 
-def exec_input(lst, dic):
+def exec_input(lst, dic, io=STDIO):
     """Gives a variable for which a value shall be inputted"""
     dic_local = dic.copy()
     read_variable = input_variable(lst)
-    val = input(f"Enter value for {read_variable}: ")
+    val = io.input(f"Enter value for {read_variable}: ")
     int_val = int(val)
     dic_local[read_variable] = int_val
     return dic_local
 
 
 def eval_binaryexpr(lst, dic):
-    """Does the math for all statmenets"""
-    result = None
-    left = eval_expression(binaryexpr_left(lst), dic)
-    right = eval_expression(binaryexpr_right(lst), dic)
-    if binaryexpr_operator(lst) == "+":
-        result = left + right
-    elif binaryexpr_operator(lst) == "-":
-        result = left - right
-    elif binaryexpr_operator(lst) == "/":
-        if right == 0:
-            raise Exception(f"Division is by zero")
+    """Does the math for all statmenets.
+    Uses a stack of its own instead of recursion, so expressions can be
+    nested any number of levels deep"""
+    values = []
+    # Expressions left to evaluate, and operators as 1-tuples waiting for
+    # the values of both their sides
+    todo = [lst]
+    while todo:
+        item = todo.pop()
+        if isinstance(item, tuple):
+            right = values.pop()
+            left = values.pop()
+            operator = item[0]
+            if operator == "+":
+                values.append(left + right)
+            elif operator == "-":
+                values.append(left - right)
+            elif operator == "/":
+                if is_zero(right):
+                    raise Exception(f"Division is by zero")
+                values.append(left / right)
+            elif operator == "*":
+                values.append(left * right)
+        elif is_binaryexpr(item):
+            todo.append((binaryexpr_operator(item),))
+            todo.append(binaryexpr_right(item))
+            todo.append(binaryexpr_left(item))
         else:
-            result = left / right
-    elif binaryexpr_operator(lst) == "*":
-        result = left * right
-    return result
+            values.append(eval_expression(item, dic))
+    return values[0]
+
+
+
+def is_ndarray(value):
+    """Returns whether a value is an array"""
+    return np is not None and isinstance(value, np.ndarray)
+
+
+def is_zero(value):
+    """Returns whether a number is zero, or an array has a zero in it"""
+    if is_ndarray(value):
+        return bool(np.any(value == 0))
+    return value == 0
+
+
+def uses_arrays(lst):
+    """Returns whether a program or statement has an array or indexing in it"""
+    if is_program(lst):
+        return any(uses_arrays(s) for s in program_statements(lst))
+    elif is_assignment(lst):
+        return expression_uses_arrays(assignment_expression(lst))
+    elif is_output(lst):
+        return expression_uses_arrays(output_expression(lst))
+    elif is_repetition(lst):
+        return (condition_uses_arrays(repetition_condition(lst))
+                or any(uses_arrays(s) for s in repetition_statements(lst)))
+    elif is_selection(lst):
+        return (condition_uses_arrays(selection_condition(lst))
+                or uses_arrays(selection_true_branch(lst))
+                or (selection_has_false_branch(lst)
+                    and uses_arrays(selection_false_branch(lst))))
+    return False
+
+
+def condition_uses_arrays(lst):
+    """Returns whether either side of a condition has an array or indexing in it"""
+    return (expression_uses_arrays(condition_left(lst))
+            or expression_uses_arrays(condition_right(lst)))
+
+
+def expression_uses_arrays(lst):
+    """Returns whether an expression has an array or indexing in it"""
+    todo = [lst]
+    while todo:
+        item = todo.pop()
+        if is_array(item) or is_indexing(item):
+            return True
+        elif is_binaryexpr(item):
+            todo.append(binaryexpr_left(item))
+            todo.append(binaryexpr_right(item))
+    return False
+
+
+def eval_array(lst):
+    """Returns an array constant as a NumPy array"""
+    if np is None:
+        raise ImportError("Arrays in calc programs need numpy")
+    return np.array(array_values(lst))
+
 
+def eval_indexing(lst, dic):
+    """Returns an element of an array"""
+    array = eval_expression(indexing_array(lst), dic)
+    element = array[eval_expression(indexing_index(lst), dic)]
+    # Elements are turned into ordinary numbers so that they behave like
+    # all other numbers in calc
+    return element.item() if isinstance(element, np.generic) else element
 
 
 def eval_variable(statement, dic):
@@ -97,11 +207,16 @@ def exec_assignment(statement, dic):
     return dic_local
 
 
-def exec_repetition(lst, dic):
-    """Runs a while loop for given condition"""
+def exec_repetition(lst, dic, io=STDIO, budget=None):
+    """Runs a while loop for given condition. Under a budget the loop is
+    never run in closed form, so every statement in it is counted"""
+    if budget is None:
+        closed_form = exec_closed_form(lst, dic)
+        if closed_form is not None:
+            return closed_form
     while eval_condition(repetition_condition(lst), dic):
         for statement in repetition_statements(lst):
-            dic = exec_statement(statement, dic) 
+            dic = exec_statement(statement, dic, io, budget)
     return dic
 
 
@@ -111,6 +226,8 @@ def eval_condition(lst, dic):
     if is_condition(lst):
         left = eval_expression(condition_left(lst), dic)
         right = eval_expression(condition_right(lst), dic)
+        if is_ndarray(left) or is_ndarray(right):
+            raise Exception("Conditions cannot compare arrays")
         if condition_operator(lst) == '>':
             if left > right:
                 return True
@@ -131,13 +248,13 @@ def eval_condition(lst, dic):
         raise SyntaxError
 
 
-def exec_selection(if_list, dic):
+def exec_selection(if_list, dic, io=STDIO, budget=None):
     """If a condition statment is true print the first print statement else print the second if it exists"""
     if eval_condition_final(if_list,dic):
         do_this = selection_true_branch(if_list)
     else: 
         do_this = selection_false_branch(if_list) if selection_has_false_branch(if_list) else None
-    return exec_statement(do_this, dic) if do_this else dic
+    return exec_statement(do_this, dic, io, budget) if do_this else dic
     
 
 def eval_condition_final(if_list,dic):
@@ -170,4 +287,5 @@ calc4 = ['calc', ['read', 'n'],
           ['set', 'n', ['n', '-', 1]]],
          ['print', 'sum']]
 
-exec_program(calc10)
\ No newline at end of file
+if __name__ == "__main__":
+    exec_program(calc10)
@@ -0,0 +1,821 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from lab6 import exec_program, calc3, calc4, calc10, talc2
+from calc_compile import compile_program
+from calc_bytecode import *
+from calc_optimize import optimize_program
+from calc import is_expression
+from calc_ast import *
+from calc_loops import analyze_loop, exec_closed_form
+from calc_io import CalcIO, BufferedSink
+from calc_budget import Budget, BudgetExceeded
+from calc_profile import profile_program
+from calc_parser import parse_program, iter_programs
+from calc_binary import *
+from calc_pool import run_programs
+from calc_cache import ResultCache, program_hash
+from calc_async import async_exec_program
+from calc_transpile import compile_python, transpile, CODE_CACHE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+nested_prog = ['calc', ['set', 'i', 3], ['set', 'total', 0],
+               ['while', ['i', '>', 0],
+                ['set', 'j', 2],
+                ['while', ['j', '>', 0],
+                 ['if', [['i', '*', 'j'], '=', 4],
+                  ['set', 'total', ['total', '+', 100]],
+                  ['set', 'total', ['total', '+', ['i', '/', 'j']]]],
+                 ['set', 'j', ['j', '-', 1]]],
+                ['set', 'i', ['i', '-', 1]]],
+               ['print', 'total']]
+
+programs = [calc3, calc4, calc10, talc2, nested_prog]
+
+
+def run_quietly(function, *args, inputs=()):
+    """Runs function with the given read inputs and returns (result, output)"""
+    output = StringIO()
+    with patch('builtins.input', side_effect=[str(i) for i in inputs]), \
+            redirect_stdout(output):
+        result = function(*args)
+    return result, output.getvalue()
+
+
+class test_compile_program(unittest.TestCase):
+    """Tests that the closure compiler behaves like exec_program"""
+
+    def test_same_environment(self):
+        """Compiled programs give the same variables and output"""
+        for program in programs:
+            expected = run_quietly(exec_program, program, {}, inputs=[5])
+            actual = run_quietly(compile_program(program), {}, inputs=[5])
+            self.assertEqual(actual, expected)
+
+    def test_not_destructive(self):
+        """The caller's variable table is only returned if nothing is written"""
+        my_vars = {'a': 5}
+        new_vars = compile_program(['calc', ['set', 'a', 7]])(my_vars)
+        self.assertEqual(my_vars, {'a': 5})
+        self.assertEqual(new_vars, {'a': 7})
+        new_vars, _ = run_quietly(compile_program(['calc', ['print', 'a']]), my_vars)
+        self.assertIs(new_vars, my_vars)
+
+    def test_fast_exec_program(self):
+        """exec_program with fast=True keeps the non-destructive guarantee"""
+        my_vars = {'a': 5}
+        new_vars = exec_program(['calc', ['set', 'a', 7]], my_vars, fast=True)
+        self.assertEqual(my_vars, {'a': 5})
+        self.assertEqual(new_vars, {'a': 7})
+        new_vars, _ = run_quietly(exec_program, ['calc', ['read', 'a']], my_vars,
+                                  True, inputs=[10])
+        self.assertEqual(my_vars, {'a': 5})
+        self.assertEqual(new_vars, {'a': 10})
+        new_vars, _ = run_quietly(exec_program, ['calc', ['print', 'a']], my_vars, True)
+        self.assertIs(new_vars, my_vars)
+
+    def test_division_by_zero(self):
+        """Division by zero raises like in exec_program"""
+        run = compile_program(['calc', ['set', 'a', [1, '/', 0]]])
+        self.assertRaisesRegex(Exception, "Division is by zero", run)
+
+    def test_common_subexpressions(self):
+        """Repeated expressions are reused until one of their variables changes"""
+        program = ['calc', ['read', 'a'], ['set', 'b', 3],
+                   ['set', 'x', [['a', '+', 'b'], '*', ['a', '+', 'b']]],
+                   ['set', 'p', [['a', '+', 'b'], '-', 1]],
+                   ['set', 'a', [['a', '+', 'b'], '+', 1]],
+                   ['set', 'y', ['a', '+', 'b']],
+                   ['read', 'b'],
+                   ['set', 'z', [['a', '+', 'b'], '/', ['a', '+', 'b']]],
+                   ['set', 'i', 2],
+                   ['while', ['i', '>', 0],
+                    ['set', 'w', [['i', '*', 'i'], '+', ['i', '*', 'i']]],
+                    ['set', 'i', ['i', '-', 1]],
+                    ['set', 'v', ['i', '*', 'i']]]]
+        expected = run_quietly(exec_program, program, {}, inputs=[4, 2])
+        actual = run_quietly(compile_program(program), {}, inputs=[4, 2])
+        self.assertEqual(actual, expected)
+        self.assertEqual(actual[0], {'a': 8, 'b': 2, 'x': 49, 'y': 11, 'z': 1.0,
+                                     'i': 0, 'w': 2, 'v': 0, 'p': 6})
+
+    def test_syntax_error(self):
+        """Malformed programs are rejected when compiled"""
+        self.assertRaises(SyntaxError, compile_program, ['calc', ['jump', 3]])
+        self.assertRaises(SyntaxError, compile_program, ['not calc'])
+
+
+class test_bytecode(unittest.TestCase):
+    """Tests the bytecode compiler, virtual machine and file format"""
+
+    def test_same_environment(self):
+        """Bytecode gives the same variables and output as exec_program"""
+        for program in programs:
+            expected = run_quietly(exec_program, program, {}, inputs=[5])
+            actual = run_quietly(run_bytecode, compile_bytecode(program), {},
+                                 inputs=[5])
+            self.assertEqual(actual, expected)
+
+    def test_not_destructive(self):
+        """The caller's variable table is never changed"""
+        my_vars = {'a': 5}
+        new_vars = run_bytecode(compile_bytecode(['calc', ['set', 'a', 7]]), my_vars)
+        self.assertEqual(my_vars, {'a': 5})
+        self.assertEqual(new_vars, {'a': 7})
+        new_vars, _ = run_quietly(run_bytecode,
+                                  compile_bytecode(['calc', ['print', 'a']]), my_vars)
+        self.assertIs(new_vars, my_vars)
+
+    def test_round_trip(self):
+        """Bytecode survives being written to and read from bytes and files"""
+        program = ['calc', ['set', 'x', -300], ['set', 'y', 2.5],
+                   ['set', 'z', [['x', '*', 10 ** 30], '+', True]]]
+        bytecode = compile_bytecode(program)
+        self.assertEqual(bytecode_from_bytes(bytecode_to_bytes(bytecode)), bytecode)
+        library = {name: compile_bytecode(p) for name, p in
+                   zip(['calc3', 'calc4', 'x'], [calc3, calc4, program])}
+        file = BytesIO()
+        dump_bytecode(library, file)
+        file.seek(0)
+        self.assertEqual(load_bytecode(file), library)
+        self.assertRaises(ValueError, bytecode_from_bytes, b'nonsense')
+
+
+class test_optimize_program(unittest.TestCase):
+    """Tests the optimizer"""
+
+    def test_same_environment(self):
+        """Optimized programs give the same variables and output"""
+        for program in programs:
+            expected = run_quietly(exec_program, program, {}, inputs=[5])
+            actual = run_quietly(exec_program, optimize_program(program), {},
+                                 inputs=[5])
+            self.assertEqual(actual, expected)
+
+    def test_folding(self):
+        """Constant expressions and identities are simplified"""
+        program = ['calc', ['set', 'x', [[2, '*', 3], '+', ['y', '*', 1]]],
+                   ['set', 'z', [['x', '+', 0], '-', [4, '/', 2]]],
+                   ['set', 'w', [1, '/', 0]]]
+        self.assertEqual(optimize_program(program),
+                         ['calc', ['set', 'x', [6, '+', 'y']],
+                          ['set', 'z', ['x', '-', 2.0]],
+                          ['set', 'w', [1, '/', 0]]])
+
+    def test_printed_identities(self):
+        """Printing x * 1 or x - 0 still prints only the value"""
+        for program in (['calc', ['set', 'a', 2], ['print', ['a', '*', 1]]],
+                        ['calc', ['set', 'a', 1.5], ['print', ['a', '-', 0]]],
+                        ['calc', ['set', 'a', 2], ['print', [1, '*', ['a', '+', 0]]]]):
+            self.assertEqual(run_quietly(exec_program, optimize_program(program)),
+                             run_quietly(exec_program, program))
+
+    def test_constant_conditions(self):
+        """if and while statements with constant conditions are decided"""
+        program = ['calc', ['if', [[1, '+', 1], '=', 2], ['set', 'a', 1], ['set', 'a', 2]],
+                   ['if', [3, '<', 2], ['print', 'a']],
+                   ['while', [1, '>', 2], ['set', 'a', 3]],
+                   ['if', ['a', '>', 0], ['if', [0, '>', 1], ['print', 'a']]]]
+        self.assertEqual(optimize_program(program),
+                         ['calc', ['set', 'a', 1],
+                          ['if', ['a', '>', 0], ['if', [0, '>', 1], ['print', 'a']]]])
+
+    def test_dead_stores(self):
+        """Assignments are removed only if overwritten before being read"""
+        program = ['calc', ['set', 'x', 1], ['set', 'y', 2], ['print', 'y'],
+                   ['set', 'x', 3], ['set', 'y', 4],
+                   ['while', ['n', '>', 0],
+                    ['set', 't', 'n'], ['set', 't', ['t', '+', 'x']],
+                    ['set', 'n', ['n', '-', 1]]],
+                   ['set', 'q', [1, '/', 'x']], ['set', 'q', 0]]
+        self.assertEqual(optimize_program(program),
+                         ['calc', ['set', 'y', 2], ['print', 'y'],
+                          ['set', 'x', 3], ['set', 'y', 4],
+                          ['while', ['n', '>', 0],
+                           ['set', 't', 'n'], ['set', 't', ['t', '+', 'x']],
+                           ['set', 'n', ['n', '-', 1]]],
+                          ['set', 'q', [1, '/', 'x']], ['set', 'q', 0]])
+        self.assertEqual(exec_program(optimize_program(program), {'n': 2}),
+                         exec_program(program, {'n': 2}))
+
+    @unittest.skipIf(numpy is None, "needs numpy")
+    def test_array_stores(self):
+        """Assignments that index or use arrays are kept, since they can raise"""
+        for program in (['calc', ['set', 'x', [['array', 1, 2], 'at', [1, '/', 0]]],
+                         ['set', 'x', 0]],
+                        ['calc', ['set', 'a', ['array', 1, 2]], ['set', 'x', ['a', 'at', 5]],
+                         ['set', 'x', 0]],
+                        ['calc', ['set', 'x', [['array', 1, 2], '+', ['array', 1, 2, 3]]],
+                         ['set', 'x', 0]]):
+            self.assertEqual(optimize_program(program), program)
+            self.assertRaises(Exception, exec_program, optimize_program(program))
+        # An array constant does not read a variable called 'array'
+        program = ['calc', ['set', 'array', 1], ['set', 'x', ['array', 1, 2]],
+                   ['set', 'array', 2]]
+        self.assertEqual(optimize_program(program), ['calc'] + program[2:])
+
+
+class test_validate_program(unittest.TestCase):
+    """Tests validation into nodes and the node interpreter"""
+
+    def test_same_environment(self):
+        """Validated programs give the same variables and output"""
+        for program in programs:
+            expected = run_quietly(exec_program, program, {}, inputs=[5])
+            actual = run_quietly(exec_validated, validate_program(program), {},
+                                 inputs=[5])
+            self.assertEqual(actual, expected)
+
+    def test_nodes(self):
+        """Nodes are tagged and have no instance dict"""
+        program = validate_program(talc2)
+        self.assertEqual([s.tag for s in program.statements],
+                         [ASSIGNMENT, ASSIGNMENT, ASSIGNMENT, OUTPUT])
+        self.assertEqual(program.statements[2].expression.tag, BINARYEXPR)
+        self.assertFalse(hasattr(program.statements[0], '__dict__'))
+
+    def test_all_errors_reported(self):
+        """Every error is reported with its path"""
+        program = ['calc', ['set', 'x', [1, '%', 2]],
+                   ['while', ['x', '>', 0], ['jump'], ['print', []]],
+                   ['if', ['x', '!', 0], ['read', 'x']]]
+        with self.assertRaises(CalcSyntaxError) as context:
+            validate_program(program)
+        self.assertEqual([path for path, _ in context.exception.errors],
+                         [(1, 2), (2, 2), (2, 3, 1), (3, 1)])
+        self.assertIn("program[2][3][1]", str(context.exception))
+        self.assertRaises(SyntaxError, validate_program, ['calc'])
+
+
+class test_closed_form(unittest.TestCase):
+    """Tests closed form evaluation of counting loops"""
+
+    def run_loop(self, loop, dic):
+        """Returns the closed form result and the result of iterating"""
+        closed = exec_closed_form(loop, dic)
+        iterated = compile_program(['calc', loop])(dic)
+        return closed, iterated
+
+    def test_counting_loops(self):
+        """Closed forms give the same result as iterating"""
+        loops = [
+            calc4[3],
+            ['while', ['n', '>', 0], ['set', 'n', ['n', '-', 1]],
+             ['set', 'sum', ['sum', '+', 'n']]],
+            ['while', ['i', '<', 'limit'], ['set', 'sum', ['n', '+', 'sum']],
+             ['set', 'count', ['count', '-', 'i']], ['set', 'i', ['i', '+', 3]]],
+            ['while', [10, '>', 'i'], ['set', 'i', ['i', '+', 4]],
+             ['set', 'sum', ['sum', '+', 2]]],
+        ]
+        for loop in loops:
+            for start in [-5, 0, 1, 7, 10, 100]:
+                dic = {'n': start, 'i': start, 'sum': 0, 'count': 1, 'limit': 50}
+                closed, iterated = self.run_loop(loop, dic)
+                self.assertEqual(closed, iterated)
+
+    def test_large_input(self):
+        """A huge counter does not take long"""
+        self.assertEqual(exec_program(calc4[:1] + calc4[2:4], {'n': 10 ** 12}),
+                         {'n': 0, 'sum': 10 ** 12 * (10 ** 12 + 1) // 2})
+
+    def test_not_recognized(self):
+        """Loops that cannot be proven are left to the interpreter"""
+        self.assertIsNone(analyze_loop(['while', ['n', '=', 0], ['set', 'n', ['n', '+', 1]]]))
+        self.assertIsNone(analyze_loop(['while', ['n', '>', 0], ['print', 'n'],
+                                        ['set', 'n', ['n', '-', 1]]]))
+        self.assertIsNone(analyze_loop(['while', ['n', '>', 0],
+                                        ['set', 'n', ['n', '-', 'sum']],
+                                        ['set', 'sum', ['sum', '+', 1]]]))
+        self.assertIsNone(exec_closed_form(calc4[3], {'n': 2.5, 'sum': 0}))
+        self.assertIsNone(exec_closed_form(calc4[3], {'n': 3}))
+        self.assertIsNone(exec_closed_form(['while', ['n', '>', 0],
+                                            ['set', 'n', ['n', '+', 1]]], {'n': 1}))
+
+
+class test_io(unittest.TestCase):
+    """Tests running programs with given inputs and output sinks"""
+
+    def test_list_sink(self):
+        """Inputs come from the iterable and printed lines go to the list"""
+        for fast in [False, True]:
+            output = []
+            result = exec_program(calc3, {}, fast, inputs=[10], output=output)
+            self.assertEqual(result['result'], 236)
+            self.assertEqual(output, ["result = 236"])
+
+    def test_engines_print_the_same(self):
+        """All engines print the same lines for the same inputs"""
+        for program in programs:
+            expected = []
+            exec_program(program, inputs=[3], output=expected)
+            outputs = [[], [], []]
+            compile_program(program)({}, CalcIO([3], outputs[0]))
+            run_bytecode(compile_bytecode(program), {}, CalcIO([3], outputs[1]))
+            exec_validated(validate_program(program), {}, CalcIO([3], outputs[2]))
+            self.assertEqual(outputs, [expected] * 3)
+
+    def test_file_sinks(self):
+        """Lines are written to files, BufferedSink writes them in batches"""
+        file = StringIO()
+        exec_program(talc2, output=file)
+        self.assertEqual(file.getvalue(), "z = 19\n")
+        file = StringIO()
+        with BufferedSink(file, batch_size=2) as sink:
+            exec_program(talc2, output=sink)
+            self.assertEqual(file.getvalue(), "")
+            exec_program(talc2, output=sink)
+            self.assertEqual(file.getvalue(), "z = 19\nz = 19\n")
+            exec_program(talc2, output=sink)
+        self.assertEqual(file.getvalue(), "z = 19\n" * 3)
+
+    def test_no_more_input(self):
+        """Running out of inputs raises EOFError"""
+        self.assertRaises(EOFError, exec_program, calc3, inputs=[])
+
+
+
+class test_profile(unittest.TestCase):
+    """Tests the statement profiler"""
+
+    def test_counts(self):
+        """Statements are counted by path together with evaluations and copies"""
+        program = ['calc', ['set', 'n', 3], ['set', 'sum', 0],
+                   ['while', ['n', '>', 0],
+                    ['set', 'sum', ['sum', '+', ['n', '*', 'n']]],
+                    ['if', ['n', '=', 2], ['print', 'n'], ['print', 'sum']],
+                    ['set', 'n', ['n', '-', 1]]]]
+        output = []
+        result, profile = profile_program(program, output=output)
+        self.assertEqual(result, exec_program(program, output=[]))
+        self.assertEqual(output, ["sum = 9", "n = 2", "sum = 14"])
+        self.assertEqual(profile.counts, {(1,): 1, (2,): 1, (3,): 1, (3, 2): 3,
+                                          (3, 3): 3, (3, 3, 2): 1, (3, 3, 3): 2,
+                                          (3, 4): 3})
+        # 2 constants, 4 loop conditions of 2 and 3 times 4 + 2 + 3 in the body
+        self.assertEqual(profile.expression_evaluations, 2 + 8 + 27)
+        self.assertEqual(profile.environment_copies, 8)
+        self.assertEqual(profile.ranked()[0], (3,))
+
+    def test_report(self):
+        """The report lists statements and the totals"""
+        _, profile = profile_program(calc3, inputs=[1], output=[])
+        report = StringIO()
+        profile.report(report)
+        self.assertIn("program[4]", report.getvalue())
+        self.assertIn("environment copies: 4", report.getvalue())
+
+    def test_closed_form_and_budget(self):
+        """Closed form loops are marked and copy once, a budget stops the run
+        after the same steps as exec_program"""
+        _, profile = profile_program(calc4, inputs=[10 ** 6], output=[])
+        self.assertEqual(profile.closed_form, {(3,)})
+        self.assertNotIn((3, 2), profile.counts)
+        # read, set and the loop
+        self.assertEqual(profile.environment_copies, 3)
+        report = StringIO()
+        profile.report(report)
+        self.assertIn("(closed form)", report.getvalue())
+        for steps in (10, 11):
+            with self.assertRaises(BudgetExceeded) as expected:
+                exec_program(calc4, {}, inputs=[10 ** 6], output=[],
+                             budget=Budget(steps=steps, check_every=1))
+            with self.assertRaises(BudgetExceeded) as actual:
+                profile_program(calc4, inputs=[10 ** 6], output=[],
+                                budget=Budget(steps=steps, check_every=1))
+            self.assertEqual((actual.exception.env, actual.exception.steps),
+                             (expected.exception.env, expected.exception.steps))
+
+
+
+class test_parser(unittest.TestCase):
+    """Tests parsing programs from text"""
+
+    def test_same_as_list_form(self):
+        """Parsing the text of a program gives the same lists"""
+        program = ['calc', ['set', "it's", -1.5e3], ['set', 'b', True],
+                   ['print', [['a]b', '+', +7], '/', 'c\\d']]]
+        for p in programs + [program]:
+            self.assertEqual(parse_program(repr(p)), p)
+        self.assertEqual(parse_program('["calc",["print" , 1, ],]'),
+                         ['calc', ['print', 1]])
+
+    def test_streaming(self):
+        """Many programs are read from a file in small chunks"""
+        text = "\n".join(repr(p) for p in programs)
+        self.assertEqual(list(iter_programs(StringIO(text), chunk_size=5)), programs)
+
+    def test_errors(self):
+        """Bad text raises SyntaxError"""
+        for text in ["['calc', ['set', 'x' 1]]", "['calc', ['print', 1]",
+                     "['calc',, ['print', 1]]", "[1, 2]", "['calc', ['print', 1]]]",
+                     "['calc', ['print', 'x]]"]:
+            self.assertRaises(SyntaxError, parse_program, text)
+        self.assertRaisesRegex(SyntaxError, "'@' at character 19",
+                               parse_program, "['calc', ['print', @]]")
+
+    def test_chunk_errors(self):
+        """A bad character is reported at once, a string over a cut is not an error"""
+        text = "['calc', ['print', @]]\n" + "['calc', ['print', 1]]\n" * 1000
+        file = StringIO(text)
+        with self.assertRaisesRegex(SyntaxError, "'@' at character 19"):
+            list(iter_programs(file, chunk_size=8))
+        self.assertLess(file.tell(), 100)
+        program = ['calc', ['set', 'a,b]c', 1], ['print', 'a,b]c']]
+        self.assertEqual(list(iter_programs(StringIO(repr(program)), chunk_size=3)),
+                         [program])
+
+
+
+class test_binary_format(unittest.TestCase):
+    """Tests the binary format for programs in the list form"""
+
+    def test_round_trip(self):
+        """Programs come back exactly, with the same constant types"""
+        program = ['calc', ['set', 'x', -300], ['set', 'y', 2.5],
+                   ['set', 'z', [['x', '*', 10 ** 30], '+', True]],
+                   ['if', ['z', '<', False], ['print', 'z'], ['read', 'z']]]
+        for p in programs + [program]:
+            self.assertEqual(program_from_bytes(program_to_bytes(p)), p)
+        decoded = program_from_bytes(program_to_bytes(program))
+        self.assertEqual([type(c) for c in decoded[3][2]], [list, str, bool])
+        library = {'calc3': calc3, 'nested': nested_prog, 'x': program}
+        file = BytesIO()
+        dump_programs(library, file)
+        file.seek(0)
+        self.assertEqual(load_programs(file), library)
+
+    def test_deep_and_errors(self):
+        """Deep expressions are fine and bad data or programs raise"""
+        expression = 'x'
+        for _ in range(10000):
+            expression = [expression, '-', 1]
+        program = ['calc', ['print', expression]]
+        file = BytesIO()
+        dump_program(program, file)
+        file.seek(0)
+        # Comparing the lists themselves would recurse too deep
+        self.assertEqual(program_to_bytes(load_program(file)), file.getvalue())
+        self.assertRaises(SyntaxError, program_to_bytes, ['calc', ['set', 'x', None]])
+        self.assertRaises(ValueError, program_from_bytes, b'nonsense')
+        data = program_to_bytes(calc4)
+        self.assertRaises(ValueError, program_from_bytes, data[:len(data) // 2])
+
+    def test_names(self):
+        """The opcodes do not hide the constants of calc_ast and calc_bytecode"""
+        import calc_ast, calc_binary, calc_bytecode
+        for module in (calc_ast, calc_bytecode):
+            for name in dir(calc_binary):
+                if name.isupper() and hasattr(module, name):
+                    self.assertIs(getattr(calc_binary, name), getattr(module, name))
+        self.assertEqual((VARIABLE, PROGRAM), (calc_ast.VARIABLE, calc_ast.PROGRAM))
+
+
+class test_transpile(unittest.TestCase):
+    """Tests translating programs to Python"""
+
+    def test_same_environment(self):
+        """Translated programs give the same variables and output"""
+        unset = ['calc', ['print', 'q'], ['set', 'y', 'q'],
+                 ['if', ['y', '=', 1], ['set', 'z', 1]], ['print', 'z'],
+                 ['set', 'w', [1.5, '/', 'y']]]
+        for program in programs + [unset]:
+            for dic in [{}, {'q': 1, 'y': 2}]:
+                try:
+                    expected = run_quietly(exec_program, program, dict(dic), inputs=[5])
+                except TypeError:
+                    self.assertRaises(TypeError, run_quietly, compile_python(program),
+                                      dict(dic), inputs=[5])
+                    continue
+                actual = run_quietly(compile_python(program), dict(dic), inputs=[5])
+                self.assertEqual(actual, expected)
+        my_vars = {'a': 5}
+        new_vars, _ = run_quietly(compile_python(['calc', ['print', 'a']]), my_vars)
+        self.assertIs(new_vars, my_vars)
+        self.assertRaisesRegex(Exception, "Division is by zero",
+                               compile_python(['calc', ['set', 'a', [1, '/', 0]]]))
+
+    def test_deep_expressions(self):
+        """Expressions deeper than Python allows are split up"""
+        expression = 'n'
+        for _ in range(1000):
+            expression = [expression, '-', 1]
+        program = ['calc', ['set', 'n', 3000], ['set', 'i', 0],
+                   ['while', [expression, '>', 0],
+                    ['set', 'n', expression], ['set', 'i', ['i', '+', 1]]]]
+        self.assertEqual(compile_python(program)(), {'n': 1000, 'i': 2})
+
+    def test_disk_cache(self):
+        """Code objects are stored on disk and loaded from there"""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            compile_python(calc4, cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            CODE_CACHE.clear()
+            with patch('calc_transpile.transpile', side_effect=AssertionError):
+                run = compile_python(calc4, cache_dir)
+            self.assertEqual(run_quietly(run, inputs=[3]),
+                             ({'n': 0, 'sum': 6}, "sum = 6\n"))
+
+    def test_memory_cache_bound(self):
+        """Only the most recently used code objects are kept in memory"""
+        CODE_CACHE.clear()
+        with patch('calc_transpile.CODE_CACHE_SIZE', 2):
+            for program in [calc3, calc4, calc3, talc2]:
+                compile_python(program)
+        self.assertEqual(list(CODE_CACHE), [program_hash(calc3), program_hash(talc2)])
+
+
+class test_budget(unittest.TestCase):
+    """Tests stopping programs that run too long"""
+
+    forever = ['calc', ['set', 'x', 0],
+               ['while', [1, '>', 0], ['set', 'x', ['x', '+', 1]]]]
+
+    def test_steps(self):
+        """The step limit stops the run with the variables so far"""
+        budget = Budget(steps=2500)
+        with self.assertRaises(BudgetExceeded) as raised:
+            exec_program(self.forever, budget=budget)
+        self.assertEqual(raised.exception.steps, 2500)
+        self.assertEqual(raised.exception.env, {'x': 2498})
+        # The budget starts anew for every run
+        self.assertRaises(BudgetExceeded, exec_program, self.forever, budget=budget)
+        self.assertRaises(BudgetExceeded, exec_program, self.forever,
+                          budget=Budget(steps=0))
+
+    def test_closed_form_loops(self):
+        """Loops that have a closed form are still counted step by step"""
+        program = ['calc', ['set', 'n', 10 ** 6], ['set', 'sum', 0],
+                   ['while', ['n', '>', 0],
+                    ['set', 'sum', ['sum', '+', 'n']], ['set', 'n', ['n', '-', 1]]]]
+        with self.assertRaises(BudgetExceeded) as raised:
+            exec_program(program, budget=Budget(steps=10, check_every=1))
+        self.assertEqual(raised.exception.steps, 10)
+        # Two sets, the while and then 3.5 iterations of the body
+        self.assertEqual(raised.exception.env, {'n': 10 ** 6 - 3, 'sum': 3999994})
+
+    def test_within_budget(self):
+        """Programs within their budget run as usual"""
+        for program in programs:
+            expected = run_quietly(exec_program, program, {}, inputs=[5])
+            actual = run_quietly(exec_program, program, {}, False, None, None,
+                                 Budget(steps=1000, seconds=10), inputs=[5])
+            self.assertEqual(actual, expected)
+
+    def test_seconds(self):
+        """The time limit stops the run"""
+        with self.assertRaises(BudgetExceeded) as raised:
+            exec_program(self.forever, budget=Budget(seconds=0.05, check_every=100))
+        self.assertEqual(raised.exception.env['x'], raised.exception.steps - 2)
+
+
+class test_run_programs(unittest.TestCase):
+    """Tests running many programs in worker processes"""
+
+    def test_same_as_exec_program(self):
+        """Results come back in order with their output"""
+        batch = programs * 4
+        inputs = [[i] for i in range(len(batch))]
+        expected = []
+        for program, values in zip(batch, inputs):
+            output = []
+            expected.append((exec_program(program, {}, inputs=values, output=output),
+                             output))
+        self.assertEqual(run_programs(batch, inputs, workers=2), expected)
+        self.assertEqual(run_programs(batch, inputs, workers=1), expected)
+
+    def test_compiled_programs(self):
+        """Bytecode is accepted and syntax errors are raised before running"""
+        self.assertEqual(run_programs([compile_bytecode(talc2)]),
+                         [({'x': 7, 'y': 12, 'z': 19}, ['z = 19'])])
+        self.assertRaises(SyntaxError, run_programs, [talc2, ['calc', ['jump']]])
+
+
+
+class test_result_cache(unittest.TestCase):
+    """Tests the cache of program results"""
+
+    def test_hits_and_misses(self):
+        """Repeated runs are answered from the cache and replay their output"""
+        cache = ResultCache(maxsize=2)
+        first, second = [], []
+        result = cache.exec_program(talc2, {}, inputs=[], output=first)
+        again = cache.exec_program(talc2, {}, inputs=[], output=second)
+        self.assertEqual(result, again)
+        self.assertIsNot(result, again)
+        self.assertEqual(first, second)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        again['z'] = 0
+        self.assertEqual(cache.exec_program(talc2, {}, inputs=[], output=[]), result)
+
+    def test_key(self):
+        """Inputs, starting variables and constant types are part of the key"""
+        cache = ResultCache()
+        program = ['calc', ['read', 'n'], ['set', 'm', ['n', '+', 'k']]]
+        self.assertEqual(cache.exec_program(program, {'k': 1}, inputs=[2]),
+                         {'k': 1, 'n': 2, 'm': 3})
+        self.assertEqual(cache.exec_program(program, {'k': 1.0}, inputs=[2]),
+                         {'k': 1.0, 'n': 2, 'm': 3.0})
+        self.assertEqual(cache.exec_program(program, {'k': 1}, inputs=[5]),
+                         {'k': 1, 'n': 5, 'm': 6})
+        self.assertEqual(cache.misses, 3)
+        self.assertNotEqual(program_hash(['calc', ['set', 'a', 1]]),
+                            program_hash(['calc', ['set', 'a', True]]))
+
+    def test_limit_and_terminal(self):
+        """Old results are dropped and terminal reads are never cached"""
+        cache = ResultCache(maxsize=2)
+        for value in [1, 2, 3]:
+            cache.exec_program(['calc', ['set', 'a', value]])
+        self.assertEqual(len(cache), 2)
+        my_vars = {'a': 5}
+        for _ in range(2):
+            new_vars, _ = run_quietly(cache.exec_program, ['calc', ['print', 'a']], my_vars)
+            self.assertIs(new_vars, my_vars)
+        result, _ = run_quietly(cache.exec_program, ['calc', ['read', 'a']], inputs=[4])
+        self.assertEqual(result, {'a': 4})
+        self.assertEqual((len(cache), cache.hits, cache.misses), (2, 1, 4))
+
+
+class test_async_exec_program(unittest.TestCase):
+    """Tests running programs as coroutines"""
+
+    def test_same_environment(self):
+        """Coroutines give the same variables and output as exec_program"""
+        async def read(prompt):
+            return 5
+        for program in programs:
+            expected_output, output = [], []
+            expected = exec_program(program, {}, inputs=[5], output=expected_output)
+            actual = asyncio.run(async_exec_program(program, {}, read, output))
+            self.assertEqual((actual, output), (expected, expected_output))
+
+    def test_concurrent_sessions(self):
+        """Sessions waiting for input and long loops do not block each other"""
+        program = ['calc', ['read', 'n'], ['set', 'sum', 0],
+                   ['while', ['n', '>', 0],
+                    ['set', 'sum', ['sum', '+', 'n']], ['set', 'n', ['n', '-', 1]]]]
+
+        async def main():
+            queue = asyncio.Queue()
+
+            async def read_queue(prompt):
+                return await queue.get()
+
+            async def read_large(prompt):
+                return 10 ** 4
+            waiting = asyncio.create_task(async_exec_program(program, {}, read_queue))
+            long = asyncio.create_task(async_exec_program(program, {}, read_large,
+                                                          yield_every=10))
+            for _ in range(5):
+                await asyncio.sleep(0)
+            running = not waiting.done() and not long.done()
+            await queue.put(3)
+            return running, await waiting, await long
+        running, waiting, long = asyncio.run(main())
+        self.assertTrue(running)
+        self.assertEqual(waiting, {'n': 0, 'sum': 6})
+        self.assertEqual(long['sum'], 10 ** 4 * (10 ** 4 + 1) // 2)
+
+
+class test_deep_expressions(unittest.TestCase):
+    """Tests expressions nested deeper than the recursion limit"""
+
+    def deep_expression(self, depth):
+        expression = 'x'
+        for i in range(depth):
+            expression = [expression, '+-'[i % 2], 1] if i % 3 else [1, '*', expression]
+        return expression
+
+    def test_exec_program(self):
+        """exec_program and the validated nodes evaluate deep expressions"""
+        expression = self.deep_expression(10000)
+        program = ['calc', ['set', 'x', 2], ['set', 'y', expression],
+                   ['if', [expression, '=', 'y'], ['set', 'same', 1]]]
+        expected = {'x': 2, 'y': 2, 'same': 1}
+        self.assertEqual(exec_program(program), expected)
+        self.assertEqual(exec_validated(validate_program(program)), expected)
+
+    def test_validation(self):
+        """Deep expressions are checked and errors get their full path"""
+        self.assertTrue(is_expression(self.deep_expression(10000)))
+        self.assertFalse(is_expression([self.deep_expression(10000), '+', ['set']]))
+        bad = ['x', '+', [[1, '*', None], '-', 2]]
+        with self.assertRaises(CalcSyntaxError) as raised:
+            validate_program(['calc', ['set', 'y', bad]])
+        self.assertEqual(raised.exception.errors[0][0], (1, 2, 2, 0, 2))
+
+
+@unittest.skipIf(numpy is None, "needs numpy")
+class test_arrays(unittest.TestCase):
+    """Tests array constants, element-wise arithmetic and indexing"""
+
+    def test_element_wise(self):
+        """Arithmetic works element by element and indexing gives numbers"""
+        program = ['calc', ['set', 'a', ['array', 1, 2, 3]],
+                   ['set', 'b', [['a', '*', 2], '+', ['array', 0.5, 0.5, 0.5]]],
+                   ['set', 'i', 0], ['set', 'total', ['array', 0, 0, 0]],
+                   ['while', ['i', '<', 3],
+                    ['set', 'total', ['total', '+', 'a']], ['set', 'i', ['i', '+', 1]]],
+                   ['set', 'c', ['b', 'at', 1]],
+                   ['set', 'd', [['a', '/', 'a'], 'at', [['a', 'at', 1], '-', 1]]],
+                   ['print', ['a', 'at', 2]]]
+        self.assertTrue(is_expression(['b', 'at', [['a', 'at', 1], '-', 1]]))
+        result, output = run_quietly(exec_program, program)
+        self.assertEqual(list(result['b']), [2.5, 4.5, 6.5])
+        self.assertEqual(list(result['total']), [3, 6, 9])
+        self.assertEqual((result['c'], result['d']), (4.5, 1.0))
+        self.assertIs(type(result['c']), float)
+        self.assertEqual(output, "3\n")
+
+    def test_division_by_zero(self):
+        """Division by an array raises if any element is zero"""
+        self.assertRaisesRegex(Exception, "Division is by zero", exec_program,
+                               ['calc', ['set', 'x', [1, '/', ['array', 1, 0]]]])
+        result = exec_program(['calc', ['set', 'x', [['array', 0, 2], '/', 2]]])
+        self.assertEqual(list(result['x']), [0.0, 1.0])
+
+    def test_other_engines(self):
+        """fast=True, the result cache and the binary format handle arrays"""
+        program = ['calc', ['set', 'a', ['array', 1, 2, True]], ['set', 'f', ['array', 0.5]],
+                   ['set', 'b', [['a', '*', 2], 'at', [['a', 'at', 2], '+', 0]]],
+                   ['print', ['a', 'at', 1]]]
+        self.assertEqual(program_from_bytes(program_to_bytes(program)), program)
+        expected = run_quietly(exec_program, program)
+        actual = run_quietly(exec_program, program, {}, True)
+        self.assertEqual(actual[1], expected[1])
+        self.assertEqual(actual[0]['b'], expected[0]['b'])
+        cache = ResultCache()
+        for _ in range(2):
+            output = []
+            result = cache.exec_program(program, {'c': numpy.array([1, 2])},
+                                        output=output)
+            self.assertEqual((result['b'], output), (4, ["2"]))
+            self.assertEqual(list(result['a']), [1, 2, 1])
+            # Changing a returned array must not change the cached result
+            result['a'][0] = 99
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_conditions(self):
+        """Conditions on arrays are rejected, on their elements they work"""
+        self.assertRaisesRegex(Exception, "Conditions cannot compare arrays", exec_program,
+                               ['calc', ['if', [['array', 1, 2], '>', 0], ['print', 1]]])
+        result = exec_program(['calc', ['set', 'a', ['array', 1, 2]],
+                               ['if', [['a', 'at', 1], '>', 1], ['set', 'x', 1]]])
+        self.assertEqual(result['x'], 1)
+
+
+@unittest.skipIf(numpy is None, "needs numpy")
+class test_batch(unittest.TestCase):
+    """Tests running a program over many input rows at once"""
+
+    def test_same_as_exec_program(self):
+        """Every lane gets the same variables as running the program on its row"""
+        from calc_batch import exec_program_batch
+        program = ['calc', ['read', 'n'], ['read', 'x'], ['set', 'sum', 0],
+                   ['while', ['n', '>', 0],
+                    ['if', ['x', '>', 'n'],
+                     ['set', 'sum', ['sum', '+', ['x', '/', 'n']]],
+                     ['set', 'sum', ['sum', '-', 'n']]],
+                    ['set', 'n', ['n', '-', 1]]],
+                   ['print', 'sum']]
+        rows = [[n, x] for n in range(-2, 8) for x in range(0, 12, 3)]
+        result = exec_program_batch(program, rows)
+        for lane, row in enumerate(rows):
+            expected, _ = run_quietly(exec_program, program, {}, inputs=row)
+            for variable, value in expected.items():
+                self.assertAlmostEqual(result[variable][lane], value)
+
+    def test_reads_per_lane(self):
+        """Lanes read as many columns as they execute read statements"""
+        from calc_batch import exec_program_batch
+        program = ['calc', ['read', 'n'], ['set', 'sum', 0],
+                   ['while', ['n', '>', 0], ['read', 'x'],
+                    ['set', 'sum', ['sum', '+', 'x']], ['set', 'n', ['n', '-', 1]]]]
+        result = exec_program_batch(program, [[0, 9, 9], [1, 5, 9], [2, 5, 7]])
+        self.assertEqual(list(result['sum']), [0, 5, 12])
+        self.assertTrue(numpy.isnan(result['x'][0]))
+        self.assertRaises(EOFError, exec_program_batch, program, [[3, 1, 1]])
+
+    def test_division_by_zero(self):
+        """Division by zero only raises in lanes that divide"""
+        from calc_batch import exec_program_batch
+        program = ['calc', ['read', 'x'],
+                   ['if', ['x', '>', 0], ['set', 'y', [1, '/', 'x']]]]
+        result = exec_program_batch(program, [[0], [2]])
+        self.assertEqual(result['y'][1], 0.5)
+        self.assertRaisesRegex(Exception, "Division is by zero", exec_program_batch,
+                               ['calc', ['read', 'x'], ['set', 'y', [1, '/', 'x']]],
+                               [[0], [2]])
+
+
+if __name__ == '__main__':
+    unittest.main()
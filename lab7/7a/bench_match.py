@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for match and search.
+
+Usage:
+$ ./bench_match.py
+"""
+
+import random
+from time import perf_counter
+
+from match import BookIndex, match, match_from, search
+
+
+def slicing_match(seq, pattern):
+    """The first version of match, which copies the rest of both lists on
+    every step. Kept to compare with"""
+    if not pattern:
+        return not seq
+    elif pattern[0] == '--':
+        if slicing_match(seq, pattern[1:]):
+            return True
+        elif not seq:
+            return False
+        else:
+            return slicing_match(seq[1:], pattern)
+    elif not seq:
+        return False
+    elif pattern[0] == '&':
+        return slicing_match(seq[1:], pattern[1:])
+    elif seq[0] == pattern[0]:
+        return slicing_match(seq[1:], pattern[1:])
+    elif isinstance(seq[0], list) and isinstance(pattern[0], list):
+        return slicing_match(seq[0], pattern[0]) and slicing_match(seq[1:], pattern[1:])
+    else:
+        return False
+
+
+WORDS = ['python', 'computer', 'science', 'an', 'introduction', 'to', 'data',
+         'structures', 'and', 'algorithms', 'programming', 'lisp', 'matematik']
+
+
+def book(title_length, rng):
+    """Returns a record shaped like the ones in books.py with a long title"""
+    return [['författare', [rng.choice(['john', 'anders', 'armen']), 'zelle']],
+            ['titel', [rng.choice(WORDS) for _ in range(title_length)]],
+            ['år', rng.randrange(1990, 2024)]]
+
+
+def books_db(count, title_length, seed=1):
+    """Returns a list of count records"""
+    rng = random.Random(seed)
+    return [book(title_length, rng) for _ in range(count)]
+
+
+PATTERNS = [
+    ('word', ['--', ['titel', ['--', 'lisp', '--']], '--']),
+    ('start', [['författare', ['john', '&']], ['titel', ['&', '--']], '&']),
+    ('end', ['&', ['titel', ['--', 'and', 'algorithms']], ['år', '&']]),
+]
+
+
+def best_time(function, repeat=3):
+    """Returns the best wall clock time of a number of calls to function"""
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_match(title_lengths=(10, 100, 400), count=200):
+    """Compares slicing, index based and compiled matching on long titles.
+    indexes is match_from on its own, match also uses the table for
+    patterns with several --"""
+    print(f"{'pattern':>8} {'title':>6} {'slicing':>10} {'indexes':>16}"
+          f" {'match':>16} {'compiled':>16}")
+    for title_length in title_lengths:
+        db = books_db(count, title_length)
+        for name, pattern in PATTERNS:
+            expected = [item for item in db if slicing_match(item, pattern)]
+            assert [item for item in db if match(item, pattern)] == expected
+            assert search(pattern, db) == expected
+            slicing = best_time(lambda: [slicing_match(item, pattern) for item in db])
+            indexes = best_time(lambda: [match_from(item, 0, pattern, 0) for item in db])
+            matched = best_time(lambda: [match(item, pattern) for item in db])
+            compiled = best_time(lambda: search(pattern, db))
+            print(f"{name:>8} {title_length:>6} {slicing:>9.4f}s"
+                  f" {indexes:>9.4f}s {slicing / indexes:>5.1f}x"
+                  f" {matched:>9.4f}s {slicing / matched:>5.1f}x"
+                  f" {compiled:>9.4f}s {slicing / compiled:>5.1f}x")
+
+
+def bench_wildcards(lengths=(10, 20, 40, 80), wildcards=3):
+    """Compares trying every split with the table for several -- on a
+    sequence that almost matches"""
+    pattern = ['--', 'a'] * wildcards + ['--', 'c']
+    print(f"{'length':>6} {'backtracking':>13} {'table':>10}")
+    for length in lengths:
+        seq = ['a'] * length + ['b']
+        table = best_time(lambda: match(seq, pattern))
+        if length <= 40:
+            backtracking = f"{best_time(lambda: match_from(seq, 0, pattern, 0)):>12.4f}s"
+        else:
+            backtracking = f"{'-':>13}"
+        print(f"{length:>6} {backtracking} {table:>9.4f}s")
+
+
+def bench_index(counts=(1000, 10000, 50000), title_length=8):
+    """Compares scanning every record with searching through a BookIndex"""
+    print(f"{'pattern':>8} {'records':>8} {'build':>9} {'scan':>9} {'index':>16}")
+    for count in counts:
+        db = books_db(count, title_length)
+        start = perf_counter()
+        index = BookIndex(db)
+        build = perf_counter() - start
+        for name, pattern in PATTERNS:
+            assert search(pattern, index) == search(pattern, db)
+            scan = best_time(lambda: search(pattern, db))
+            indexed = best_time(lambda: search(pattern, index))
+            print(f"{name:>8} {count:>8} {build:>8.4f}s {scan:>8.4f}s"
+                  f" {indexed:>8.4f}s {scan / indexed:>5.1f}x")
+
+
+if __name__ == "__main__":
+    bench_match()
+    print()
+    bench_wildcards()
+    print()
+    bench_index()
@@ -1,37 +1,335 @@
 # Encoding: ISO-8859-1
+import json
+from ast import literal_eval
+from collections import OrderedDict
+
 
 def match(seq, pattern):
     """
     Returns whether given sequence matches the given pattern
     """
-    if not pattern:
-        return not seq
-    elif pattern[0] == '--':
-        if match(seq, pattern[1:]):
-            return True
-        elif not seq:
+    if pattern.count('--') > 1:
+        return match_table(seq, pattern)
+    return match_from(seq, 0, pattern, 0)
+
+
+def match_from(seq, i, pattern, j):
+    """
+    Returns whether seq[i:] matches pattern[j:], using positions in the
+    lists instead of copying what is left of them
+    """
+    seq_length = len(seq)
+    pattern_length = len(pattern)
+    while j < pattern_length:
+        element = pattern[j]
+        if element == '--':
+            # Let -- take 0, 1, 2, ... elements until the rest matches
+            for k in range(i, seq_length + 1):
+                if match_from(seq, k, pattern, j + 1):
+                    return True
+            return False
+        elif i == seq_length:
             return False
+        item = seq[i]
+        if element == '&' or item == element:
+            pass
+        elif isinstance(item, list) and isinstance(element, list):
+            if not match(item, element):
+                return False
         else:
-            return match(seq[1:], pattern)
-    elif not seq:
-        return False
-    elif pattern[0] == '&':
-        return match(seq[1:], pattern[1:])
-    elif seq[0] == pattern[0]:
-        return match(seq[1:], pattern[1:])
-    elif isinstance(seq[0], list) and isinstance(pattern[0], list):
-        first = match(seq[0], pattern[0])
-        rest = match(seq[1:], pattern[1:])
-        return first and rest
-    else:
-        return False
+            return False
+        i += 1
+        j += 1
+    return i == seq_length
+
+
+def match_table(seq, pattern):
+    """
+    Returns whether seq matches pattern by working out, from the end of the
+    pattern backwards, which seq[i:] match pattern[j:]. Takes time
+    proportional to len(seq) * len(pattern) however many -- there are,
+    where match_from can try every way to split seq between them
+    """
+    seq_length = len(seq)
+    # rest[i] is whether seq[i:] matches the part of the pattern after j
+    rest = [False] * seq_length + [True]
+    for j in range(len(pattern) - 1, -1, -1):
+        element = pattern[j]
+        row = [False] * (seq_length + 1)
+        if element == '--':
+            row[seq_length] = rest[seq_length]
+            for i in range(seq_length - 1, -1, -1):
+                row[i] = rest[i] or row[i + 1]
+        else:
+            for i in range(seq_length):
+                if rest[i + 1]:
+                    item = seq[i]
+                    row[i] = (element == '&' or item == element or (
+                        isinstance(item, list) and isinstance(element, list)
+                        and match(item, element)))
+        rest = row
+    return rest[0]
 
 
 def search(pattern, db):
-    """Searches through a database and returns all the items in the db corresponding to the pattern"""
-    lst = []
-    for item in db: 
-        if match(item, pattern):
-            lst.append(item)
-    return lst
- 
+    """Searches through a database and returns all the items in the db corresponding to the pattern.
+    db can also be a BookIndex, then only the records it finds candidates are matched"""
+    if isinstance(db, BookIndex):
+        return db.search(pattern)
+    return compile_pattern(pattern).search(db)
+
+
+def iter_search(pattern, source, limit=None):
+    """
+    Yields the records in source that match the pattern, reading one record
+    at a time. source is a file name or an open text file with one record
+    per line, as JSON or as a Python list. Stops after limit matches
+    """
+    if limit is not None and limit <= 0:
+        return
+    if isinstance(source, str):
+        with open(source, encoding='utf-8') as file:
+            yield from iter_search(pattern, file, limit)
+        return
+    compiled = compile_pattern(pattern)
+    found = 0
+    for line in source:
+        if not line.strip():
+            continue
+        record = read_record(line)
+        if compiled.match(record):
+            yield record
+            found += 1
+            if found == limit:
+                return
+
+
+def read_record(line):
+    """Returns the record on one line, written as JSON or as a Python list"""
+    try:
+        return json.loads(line)
+    except ValueError:
+        # Python lists with 'quotes' are not JSON
+        return literal_eval(line.strip())
+
+
+def dump_records(db, file):
+    """Writes the records of a database to a text file, one JSON record per line"""
+    for record in db:
+        file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+# A compiled pattern is split at every -- into segments of fixed length.
+# The first segment must match at the start of the sequence and the last
+# one at the end; the ones in between are found one after the other, each
+# as far to the left as possible, which is enough since -- can take any
+# number of elements. Matching is therefore linear in the length of the
+# sequence. A segment starting with a literal is found with list.index.
+
+ANY = object()
+
+PATTERN_CACHE_SIZE = 256
+pattern_cache = OrderedDict()
+
+
+def compile_pattern(pattern):
+    """
+    Returns a compiled pattern for the given pattern, reusing one compiled
+    earlier for an equal pattern if there is one
+    """
+    key = pattern_key(pattern)
+    try:
+        cached = key in pattern_cache
+    except TypeError:
+        # Something in the pattern cannot be hashed, so it is not cached
+        return CompiledPattern(pattern)
+    if cached:
+        pattern_cache.move_to_end(key)
+        return pattern_cache[key]
+    compiled = pattern_cache[key] = CompiledPattern(pattern)
+    if len(pattern_cache) > PATTERN_CACHE_SIZE:
+        pattern_cache.popitem(last=False)
+    return compiled
+
+
+def pattern_key(pattern):
+    """Returns a hashable key that is equal for patterns with the same structure"""
+    return (list, tuple(pattern_key(element) if isinstance(element, list) else element
+                        for element in pattern))
+
+
+class CompiledPattern:
+    """A pattern analysed once, for matching many sequences"""
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        segments = [[]]
+        for element in pattern:
+            if element == '--':
+                segments.append([])
+            elif element == '&':
+                segments[-1].append(ANY)
+            elif isinstance(element, list):
+                segments[-1].append(CompiledPattern(element))
+            else:
+                segments[-1].append(element)
+        self.min_length = sum(len(segment) for segment in segments)
+        self.has_wildcard = len(segments) > 1
+        self.prefix = segments[0]
+        self.suffix = segments[-1] if self.has_wildcard else []
+        self.middle = [(segment, anchor(segment))
+                       for segment in segments[1:-1] if segment]
+
+    def match(self, seq):
+        """Returns whether seq matches the pattern"""
+        length = len(seq)
+        if length < self.min_length:
+            return False
+        if not self.has_wildcard:
+            return length == self.min_length and segment_matches(self.prefix, seq, 0)
+        end = length - len(self.suffix)
+        if not (segment_matches(self.prefix, seq, 0)
+                and segment_matches(self.suffix, seq, end)):
+            return False
+        i = len(self.prefix)
+        for segment, literal in self.middle:
+            last = end - len(segment)
+            while True:
+                if literal is not ANY:
+                    try:
+                        i = seq.index(literal, i, last + 1)
+                    except ValueError:
+                        return False
+                elif i > last:
+                    return False
+                if segment_matches(segment, seq, i):
+                    break
+                i += 1
+            i += len(segment)
+        return True
+
+    def search(self, db):
+        """Returns all the items in db that match the pattern"""
+        return [item for item in db if self.match(item)]
+
+
+def anchor(segment):
+    """Returns the literal a segment starts with, or ANY if it has none"""
+    first = segment[0]
+    if first is ANY or isinstance(first, CompiledPattern):
+        return ANY
+    return first
+
+
+def segment_matches(segment, seq, i):
+    """Returns whether the segment matches seq from position i"""
+    for element in segment:
+        item = seq[i]
+        i += 1
+        if element is ANY:
+            continue
+        elif isinstance(element, CompiledPattern):
+            if not (isinstance(item, list) and element.match(item)):
+                return False
+        elif item != element:
+            return False
+    return True
+
+
+# A BookIndex maps every token in the records of a database to the ids of
+# the records it appears in, together with the path of labels leading to
+# it. Any list of two elements starting with a token adds that token as a
+# label, other lists add None. That is ['titel', [...]] and ['år', 2010],
+# but also a two-part name like ['john', 'zelle']. In
+#     [['författare', ['john', 'zelle']], ['titel', [...]], ['år', 2010]]
+# 'zelle' is at the path ('författare', 'john') and 2010 at ('år',).
+#
+# A token is filed under every beginning of its path, so a key (path, token)
+# means that the token is somewhere below path. The tokens of a pattern can
+# then be looked up even where the pattern does not tell the exact path,
+# e.g. below a list with -- in it. Every record matching the pattern has
+# all of the pattern's tokens, so search only needs to run match on the
+# records found under all of them.
+
+
+class BookIndex:
+    """An inverted index of the tokens in a database of records"""
+
+    def __init__(self, db):
+        self.db = list(db)
+        self.postings = {}
+        for record_id, record in enumerate(self.db):
+            if isinstance(record, list):
+                self.add(record_id, record, ())
+
+    def add(self, record_id, lst, path):
+        """Files the tokens in lst and the lists inside it under their paths"""
+        for element in lst:
+            if isinstance(element, list):
+                self.add(record_id, element, path + (label(element),))
+                continue
+            for length in range(len(path) + 1):
+                try:
+                    ids = self.postings.setdefault((path[:length], element), [])
+                except TypeError:
+                    # Tokens that cannot be hashed are not indexed
+                    break
+                if not ids or ids[-1] != record_id:
+                    ids.append(record_id)
+
+    def candidates(self, pattern):
+        """Returns the ids of the records that have every token of the pattern"""
+        keys = set()
+        pattern_keys(pattern, (), keys)
+        postings = [self.postings.get(key, ()) for key in keys]
+        if not postings:
+            return list(range(len(self.db)))
+        postings.sort(key=len)
+        ids = set(postings[0])
+        for other in postings[1:]:
+            ids.intersection_update(other)
+            if not ids:
+                break
+        return sorted(ids)
+
+    def search(self, pattern):
+        """Returns all the records that match the pattern"""
+        compiled = compile_pattern(pattern)
+        db = self.db
+        return [db[i] for i in self.candidates(pattern) if compiled.match(db[i])]
+
+
+def label(lst):
+    """Returns the label a list adds to the path of the tokens in it"""
+    if len(lst) == 2 and not isinstance(lst[0], list):
+        return lst[0]
+    return None
+
+
+def pattern_keys(pattern, path, keys, known=True):
+    """Adds to keys the (path, token) pairs every matching record has.
+    Below a list whose label is not known, every token is looked up under
+    the last path that is known"""
+    for element in pattern:
+        if element == '&' or element == '--':
+            continue
+        elif not isinstance(element, list):
+            if is_hashable((path, element)):
+                keys.add((path, element))
+        elif not known or '--' in element:
+            # Could match a list of any length, so the label is not known
+            pattern_keys(element, path, keys, False)
+        elif len(element) == 2 and (element[0] == '&' or isinstance(element[0], list)):
+            # The matching list may or may not have a label
+            pattern_keys(element, path, keys, False)
+        else:
+            pattern_keys(element, path + (label(element),), keys)
+
+
+def is_hashable(value):
+    """Returns whether value can be used as a key"""
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
@@ -39,6 +39,138 @@ class test_functions(unittest.TestCase):
                 lst.append(item)
         return lst
         
+class test_match_positions(unittest.TestCase):
+    """Tests that match works on positions with the same results"""
+
+    def test_same_as_before(self):
+        """&, -- and nested lists behave as in the first version of match"""
+        from bench_match import slicing_match
+        seqs = [[], ['a'], ['a', 'b', 'a'], [['a', 'b'], 'c'], [['a'], ['a', ['b']]]]
+        patterns = [[], ['--'], ['&'], ['a', '--'], ['--', 'a'], ['--', 'b', '--'],
+                    ['&', '&', '&'], [['a', '&'], '--'], [['--'], ['a', ['&']]],
+                    ['--', '--', 'a'], [['a', 'b'], 'c'], ['a', '&', '--', 'a']]
+        for seq in seqs + db:
+            for pattern in patterns + [[['författare', ['&', 'zelle']], '--']]:
+                self.assertEqual(match(seq, pattern), slicing_match(seq, pattern),
+                                 (seq, pattern))
+
+    def test_long_sequences(self):
+        """Long lists match without copying or deep recursion"""
+        seq = ['x'] * 100000 + ['end']
+        self.assertTrue(match(seq, ['--', 'end']))
+        self.assertTrue(match(seq, ['&'] * 100000 + ['end']))
+        self.assertFalse(match(seq, ['--', 'x']))
+
+    def test_many_wildcards(self):
+        """Patterns with several -- are matched in polynomial time"""
+        from match import match_from, match_table
+        import random
+        rng = random.Random(3)
+        for _ in range(300):
+            seq = [rng.choice('ab') for _ in range(rng.randrange(6))]
+            pattern = [rng.choice(['a', 'b', '&', '--']) for _ in range(rng.randrange(6))]
+            self.assertEqual(match_table(seq, pattern), match_from(seq, 0, pattern, 0),
+                             (seq, pattern))
+        seq = ['a'] * 2000 + ['b']
+        self.assertFalse(match(seq, ['--', 'a', '--', 'a', '--', 'a', '--', 'c']))
+        self.assertTrue(match([seq, 'x'], [['--', 'a', '--', 'b'], '--']))
+
+
+class test_compile_pattern(unittest.TestCase):
+    """Tests compiled patterns and their cache"""
+
+    def test_same_as_match(self):
+        """Compiled patterns match exactly what match does"""
+        from match import compile_pattern
+        import random
+        rng = random.Random(5)
+
+        def element(depth):
+            choice = rng.randrange(6 if depth < 2 else 4)
+            if choice >= 4:
+                return [element(depth + 1) for _ in range(rng.randrange(4))]
+            return ['a', 'b', '&', '--'][choice]
+        for _ in range(2000):
+            pattern = [element(0) for _ in range(rng.randrange(6))]
+            seq = [element(1) for _ in range(rng.randrange(7))]
+            seq = [e if e not in ('&', '--') else 'a' for e in seq]
+            self.assertEqual(compile_pattern(pattern).match(seq), match(seq, pattern),
+                             (seq, pattern))
+        pattern = [['författare', ['&', 'zelle']], '--']
+        self.assertEqual(compile_pattern(pattern).search(db),
+                         [item for item in db if match(item, pattern)])
+        self.assertEqual(len(search(pattern, db)), 1)
+
+    def test_cache(self):
+        """Equal patterns share one compiled pattern and the cache is bounded"""
+        import match as module
+        self.assertIs(module.compile_pattern(['a', ['--', 'b']]),
+                      module.compile_pattern(['a', ['--', 'b']]))
+        self.assertIsNot(module.compile_pattern(['a', ('b',)]),
+                         module.compile_pattern(['a', ['b']]))
+        for i in range(module.PATTERN_CACHE_SIZE + 10):
+            module.compile_pattern(['--', i])
+        self.assertEqual(len(module.pattern_cache), module.PATTERN_CACHE_SIZE)
+        self.assertTrue(module.compile_pattern([{'unhashable'}, '--']).match([{'unhashable'}]))
+
+
+class test_book_index(unittest.TestCase):
+    """Tests searching through an inverted index"""
+
+    def test_same_as_scanning(self):
+        """Searching the index finds exactly what scanning db finds"""
+        from match import BookIndex
+        from bench_match import books_db
+        records = db + books_db(100, 5)
+        index = BookIndex(records)
+        author, year = records[3][0][0], records[3][2][0]
+        patterns = [['--', ['titel', ['--', 'python', '--']], '--'],
+                    [[author, ['john', 'zelle']], '&', '&'],
+                    ['&', '&', [year, 2009]], ['--', [year, '&']], ['--'],
+                    [['&', ['john', '&']], '--'], [['--', ['&', 'zelle']], '--'],
+                    ['--', ['titel', ['diskret', 'matematik']], '--'],
+                    ['--', ['titel', ['&', 'nothing']], '--']]
+        for pattern in patterns:
+            self.assertEqual(search(pattern, index),
+                             [item for item in records if match(item, pattern)], pattern)
+
+    def test_candidates(self):
+        """Only records with every token of the pattern are candidates"""
+        from match import BookIndex
+        index = BookIndex(db)
+        self.assertEqual(index.candidates(['--', ['titel', ['--', 'python', '--']], '--']),
+                         [0, 3])
+        self.assertEqual(index.candidates(['--', ['titel', ['--', 'zelle', '--']], '--']), [])
+        self.assertEqual(index.candidates(['--']), [0, 1, 2, 3, 4])
+
+
+class test_iter_search(unittest.TestCase):
+    """Tests searching records read one line at a time"""
+
+    def test_file(self):
+        """Records are read from a file and matches come in order"""
+        from match import iter_search, dump_records
+        import os
+        import tempfile
+        pattern = ['--', ['titel', ['--', 'python', '--']], '--']
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'books.txt')
+            with open(name, 'w', encoding='utf-8') as file:
+                dump_records(db, file)
+                file.write("\n" + repr(db[3]) + "\n")
+            self.assertEqual(list(iter_search(pattern, name)), search(pattern, db) + [db[3]])
+            self.assertEqual(list(iter_search(pattern, name, limit=1)), [db[0]])
+            self.assertEqual(list(iter_search(pattern, name, limit=0)), [])
+
+    def test_lazy(self):
+        """Reading stops at the limit"""
+        from match import iter_search
+        import json
+        lines = iter([json.dumps(record) + "\n" for record in db])
+        self.assertEqual(list(iter_search(['--'], lines, limit=2)), db[:2])
+        self.assertEqual(len(list(lines)), 3)
+
+
 if __name__ == '__main__':
     unittest.main()
     
\ No newline at end of file